@@ -1,4 +1,8 @@
-import psycopg2
+import csv
+import io
+import threading
+
+from psycopg2.pool import ThreadedConnectionPool
 
 # Centralized database configuration
 DB_CONFIG = {
@@ -9,11 +13,175 @@ DB_CONFIG = {
     "password": "postgres"
 }
 
+POOL_MAXCONN = 4
+
+_pool = None
+# Loaders start on several threads at once; only one of them may build the pool
+_pool_lock = threading.Lock()
+# One slot per pooled connection: getconn() raises instead of waiting when the pool is
+# exhausted, so callers (e.g. two app sessions loading at once) wait for a slot first
+_pool_slots = threading.BoundedSemaphore(POOL_MAXCONN)
+
+def get_pool():
+    """
+    Returns the process-wide connection pool, creating it on first use so the loaders
+    share connections instead of opening a new session per call.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(1, POOL_MAXCONN, **DB_CONFIG)
+    return _pool
+
 def get_connection():
     """
-    Returns a new connection to the PostgreSQL database using the configuration above.
+    Returns a pooled connection to the PostgreSQL database using the configuration above,
+    waiting for one to be released when all of them are in use.
+    Hand it back with release_connection() instead of closing it.
     Usage:
-        from db_connection import get_connection
+        from db_connection import get_connection, release_connection
+        conn = get_connection()
+        ...
+        release_connection(conn)
+    """
+    _pool_slots.acquire()
+    try:
+        return get_pool().getconn()
+    except Exception:
+        _pool_slots.release()
+        raise
+
+def release_connection(conn):
+    """Returns a connection obtained from get_connection() to the pool."""
+    try:
+        get_pool().putconn(conn)
+    finally:
+        _pool_slots.release()
+
+def load_records(table_name, columns, records, key_columns, filter_column):
+    """
+    Loads records into table_name in one transaction, skipping rows whose key_columns are
+    already stored, so re-running a load is safe. That is why the transaction commits with
+    synchronous_commit off: a crash just after commit may lose the load, and running it
+    again restores it.
+    - columns: target column names, in the same order as each record tuple
+    - records: list of tuples
+    - key_columns: the table's unique key (a subset of columns)
+    - filter_column: column of the key that bounds the batch (e.g. its dates or months), so
+      only that slice of the stored keys is fetched for the comparison
+    Errors are printed and the transaction is rolled back.
+    Returns the number of rows inserted, or None if the load failed.
+    """
+    key_positions = [columns.index(col) for col in key_columns]
+    filter_position = columns.index(filter_column)
+    conn = None
+    cur = None
+    try:
         conn = get_connection()
+        cur = conn.cursor()
+        cur.execute("SET LOCAL synchronous_commit = off")
+        # Concurrent loads of this table wait here until this one commits, so two of them
+        # cannot both see the table empty and COPY the same keys in without conflict handling
+        cur.execute(f"LOCK TABLE {table_name} IN SHARE ROW EXCLUSIVE MODE")
+        if table_is_empty(cur, table_name):
+            # Fresh table: nothing to deduplicate against, COPY straight in
+            inserted = copy_records(cur, table_name, columns, records)
+        else:
+            existing = fetch_existing_keys(
+                cur, table_name, key_columns, filter_column, {rec[filter_position] for rec in records}
+            )
+            new_records = [rec for rec in records if tuple(rec[i] for i in key_positions) not in existing]
+            if not new_records:
+                print("All records already exist in the database. No new records to insert.")
+                return 0
+            # ON CONFLICT DO NOTHING still guards against keys stored by another writer
+            inserted = copy_records(cur, table_name, columns, new_records, conflict_columns=key_columns)
+        conn.commit()
+        print(f"Inserted {inserted} new rows into {table_name}. Skipped {len(records) - inserted} duplicate rows.")
+        return inserted
+    except Exception as e:
+        print("Error during insertion:", e)
+        if conn is not None:
+            conn.rollback()
+        return None
+    finally:
+        if cur is not None:
+            cur.close()
+        if conn is not None:
+            release_connection(conn)
+
+def copy_records(cur, table_name, columns, records, conflict_columns=None, page_size=10000):
+    """
+    Bulk-loads records into table_name with COPY ... FROM STDIN (CSV format).
+    - cur: open psycopg2 cursor (the caller owns commit/rollback)
+    - columns: target column names, in the same order as each record tuple
+    - records: iterable of tuples (a generator is fine; it is consumed once)
+    - conflict_columns: if given, rows are COPYed into a temporary staging table and
+      moved with INSERT ... ON CONFLICT (conflict_columns) DO NOTHING, so rows whose
+      key already exists are skipped by Postgres (needs a unique index on those columns)
+    - page_size: rows buffered per COPY, which bounds the CSV buffer's memory
+    None/NaN/NaT values are sent as NULL.
+    Returns the number of rows written to table_name.
+    Text (CSV) COPY is used rather than binary: the value columns are NUMERIC, whose binary
+    wire format is base-10000 digits rather than IEEE-754 floats, so binary COPY would still
+    convert every float and would need a separate encoder.
+    """
+    column_list = ", ".join(columns)
+    copy_table = table_name
+    if conflict_columns is not None:
+        copy_table = f"stage_{table_name}"
+        cur.execute(f"CREATE TEMP TABLE {copy_table} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP")
+    # Rows travel through COPY and the move out of staging is one INSERT ... SELECT, so there is
+    # no per-row INSERT whose parse/plan a PREPARE ... EXECUTE statement would save
+    copy_options = "FORMAT CSV, NULL '\\N'"
+    if conflict_columns is not None:
+        # The staging table was created in this transaction, so its rows can be written frozen
+        copy_options += ", FREEZE"
+    copy_sql = f"COPY {copy_table} ({column_list}) FROM STDIN WITH ({copy_options})"
+
+    copied = 0
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    pending = 0
+    for rec in records:
+        # NaN and NaT are the only values not equal to themselves
+        writer.writerow([r"\N" if v is None or v != v else v for v in rec])
+        pending += 1
+        if pending == page_size:
+            buf.seek(0)
+            cur.copy_expert(copy_sql, buf)
+            copied += pending
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+    if pending:
+        buf.seek(0)
+        cur.copy_expert(copy_sql, buf)
+        copied += pending
+
+    if conflict_columns is None:
+        return copied
+    cur.execute(f"""
+        INSERT INTO {table_name} ({column_list})
+        SELECT {column_list} FROM {copy_table}
+        ON CONFLICT ({", ".join(conflict_columns)}) DO NOTHING
+    """)
+    return cur.rowcount
+
+def fetch_existing_keys(cur, table_name, key_columns, filter_column, filter_values):
     """
-    return psycopg2.connect(**DB_CONFIG)
+    Returns the set of key tuples already stored in table_name for rows whose
+    filter_column is one of filter_values (e.g. the dates or months of the batch).
+    One scan of that slice replaces a lookup per key; callers diff their batch against it.
+    """
+    cur.execute(
+        f"SELECT {', '.join(key_columns)} FROM {table_name} WHERE {filter_column} = ANY(%s)",
+        (list(filter_values),)
+    )
+    return set(cur.fetchall())
+
+def table_is_empty(cur, table_name):
+    """Returns True if table_name has no rows (a single-row probe, not a count)."""
+    cur.execute(f"SELECT 1 FROM {table_name} LIMIT 1")
+    return cur.fetchone() is None
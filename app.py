@@ -7,47 +7,24 @@ Production-ready Streamlit app: C9 Data Upload & Automation
 - Defensive error handling and type hints
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import io
 import logging
 import os
 from pathlib import Path
+import queue
+import shutil
 import tempfile
-from typing import Dict, Optional
+import threading
+from typing import Dict, Optional, Sequence
+import zipfile
 
 import pandas as pd
 import streamlit as st
 
-# Local automation modules (user-provided). Ensure these import paths are correct.
-from automate_consumption_data import (
-    process_hrbr_consumption,
-    split_units_to_hourly,
-    consolidate_units_hourly,
-    add_tod_slot,
-    merge_hourly_to_tod,
-    split_hourly_to_15min,
-    merge_hourly_to_daily,
-)
-from automate_generation_data import (
-    merge_inverter_data,
-    aggregate_15min,
-    split_date_time,
-    merge_generation_consumption,
-    aggregate_hourly,
-)
-from automate_settlement import (
-    calculate_matched_settlement,
-    add_unit_id,
-    monthly_aggregation,
-    apply_monthly_banking_settlement,
-    calculate_savings_comparison,
-)
-
 import validation_utils
-
-# --- DB insertion modules ---
-from DB.insert_15min_data import insert_15min_data
-from DB.insert_hourly_data import insert_hourly_data
-from DB.insert_monthly_banking_settlement import insert_monthly_banking_settlement
-from DB.insert_monthly_savings import insert_monthly_savings
+from excel_utils import read_excel, sheet_cache
 
 # --- App config ---
 st.set_page_config(page_title="Data Upload & Automation", layout="wide")
@@ -100,15 +77,49 @@ def init_session_state() -> None:
 
 
 def save_uploaded_file(uploaded, dest_path: Path) -> None:
-    """Save a Streamlit uploaded file to disk (binary write).
+    """Save a Streamlit uploaded file to disk (binary write, copied in 1 MiB chunks).
 
     Args:
         uploaded: UploadedFile from Streamlit (supports .read()).
         dest_path: Path where file will be written.
     """
     dest_path.parent.mkdir(parents=True, exist_ok=True)
+    uploaded.seek(0)
     with open(dest_path, "wb") as f:
-        f.write(uploaded.getbuffer())
+        shutil.copyfileobj(uploaded, f, 1 << 20)
+
+
+@st.cache_data(show_spinner=False)
+def parse_xlsx_columns(data: bytes, columns: tuple) -> pd.DataFrame:
+    """Parse only the given columns of an xlsx held in memory (calamine engine when installed).
+
+    Cached on the file bytes, so re-validating the same upload or reusing it in
+    Step 4 does not parse the workbook again.
+    """
+    wanted = set(columns)
+    return read_excel(io.BytesIO(data), usecols=lambda c: c in wanted)
+
+
+def link_or_copy(src: Path, dest_path: Path) -> None:
+    """Hard-link src to dest_path when both are on one filesystem (no bytes copied), else copy it.
+
+    The tmpdir files are not modified after the workflow finishes, so sharing the inode with
+    the project folder copy is safe; the link survives the tmpdir cleanup.
+    """
+    try:
+        os.link(src, dest_path)
+    except OSError:
+        # different filesystem (e.g. tmpfs /tmp), links not supported, or dest_path exists
+        shutil.copy(src, dest_path)
+
+
+def read_uploaded_columns(uploaded, columns: Sequence[str]) -> pd.DataFrame:
+    """Parse only the given columns of an uploaded workbook.
+
+    Columns the file does not have are simply absent from the result, so the
+    validate_columns check can report them with its usual message.
+    """
+    return parse_xlsx_columns(bytes(uploaded.getbuffer()), tuple(columns))
 
 
 # --- Initialize session state ---
@@ -162,9 +173,18 @@ elif st.session_state["flow_step"] == 2:
     with st.form(key="consumption_data_form"):
         hrbr_file = st.file_uploader("Upload HRBR Unit Excel file", type=["xlsx"], key="hrbr")
         st.markdown("#### Unit Values (editable)")
-        unit_values: Dict[str, float] = {}
-        for unit, val in DEFAULT_UNIT_VALUES.items():
-            unit_values[unit] = st.number_input(f"{unit}", value=float(val), key=f"unit_{unit}")
+        # One editable table instead of a number_input widget per unit
+        current_values = st.session_state.get("unit_values", DEFAULT_UNIT_VALUES)
+        unit_df = pd.DataFrame({"Unit": list(current_values), "Value": [float(v) for v in current_values.values()]})
+        edited_units = st.data_editor(
+            unit_df,
+            num_rows="fixed",
+            disabled=["Unit"],
+            hide_index=True,
+            column_config={"Value": st.column_config.NumberColumn("Value", required=True)},
+            key="unit_editor",
+        )
+        unit_values: Dict[str, float] = dict(zip(edited_units["Unit"], edited_units["Value"].astype(float)))
 
         validate_btn = st.form_submit_button("Validate Consumption Data")
         back_btn = st.form_submit_button("Back")
@@ -174,25 +194,18 @@ elif st.session_state["flow_step"] == 2:
             st.rerun()
 
         if validate_btn:
-            validation_steps = [
-                ("Checking required columns...", lambda df: validation_utils.validate_columns(df, ["DateTime", "Consumption"], context="Consumption")),
-                ("Checking for missing values...", lambda df: validation_utils.validate_no_nans(df, ["DateTime", "Consumption"], context="Consumption")),
-                ("Checking for positive values...", lambda df: validation_utils.validate_positive_values(df, ["Consumption"], context="Consumption")),
-                ("Checking for non-empty data...", lambda df: validation_utils.validate_nonempty(df, context="Consumption")),
-                ("Checking month consistency...", lambda df: validation_utils.validate_month(df, "DateTime", context="Consumption") if "DateTime" in df.columns else None),
-                # ("Checking 15-min granularity...", lambda df: validation_utils.validate_15min_granularity(df, "DateTime", context="Consumption") if "DateTime" in df.columns else None),
-            ]
             validation_results = []
             all_passed = True
             try:
                 if hrbr_file is None:
                     raise ValueError("No HRBR Excel file uploaded. Please select and upload the required file before proceeding. Accepted format: .xlsx")
-                df = pd.read_excel(hrbr_file)
-                for step_msg, check_fn in validation_steps:
-                    try:
-                        check_fn(df)
+                df = read_uploaded_columns(hrbr_file, ["DateTime", "Consumption"])
+                # 15-min granularity is not checked on uploads (validation_utils.validate_15min_granularity)
+                checks = validation_utils.validate_upload(df, ["DateTime", "Consumption"], ["Consumption"], "DateTime", context="Consumption")
+                for step_msg, ve in checks:
+                    if ve is None:
                         validation_results.append({"message": step_msg, "status": "passed"})
-                    except Exception as ve:
+                    else:
                         # Add more context to the error
                         user_tip = (
                             "Tip: Double-check your file for correct columns, missing values, and data format. "
@@ -204,7 +217,6 @@ elif st.session_state["flow_step"] == 2:
                             "error": f"{ve} | {user_tip}"
                         })
                         all_passed = False
-                        break
                 if all_passed:
                     validation_results.append({"message": "✅ All consumption data validations passed!", "status": "final_pass"})
                 st.session_state["consumption_validation_results"] = validation_results
@@ -273,25 +285,18 @@ elif st.session_state["flow_step"] == 3 and st.session_state.get("validation_pas
             st.rerun()
 
         if validate_btn:
-            validation_steps = [
-                ("Checking required columns...", lambda df: validation_utils.validate_columns(df, ["Date & Time", "Day Gen (KWh)"], context="Generation")),
-                ("Checking for missing values...", lambda df: validation_utils.validate_no_nans(df, ["Date & Time", "Day Gen (KWh)"], context="Generation")),
-                ("Checking for positive values...", lambda df: validation_utils.validate_positive_values(df, ["Day Gen (KWh)"], context="Generation")),
-                ("Checking for non-empty data...", lambda df: validation_utils.validate_nonempty(df, context="Generation")),
-                ("Checking month consistency...", lambda df: validation_utils.validate_month(df, "Date & Time", context="Generation") if "Date & Time" in df.columns else None),
-                # ("Checking 15-min granularity...", lambda df: validation_utils.validate_15min_granularity(df, "Date & Time", context="Generation") if "Date & Time" in df.columns else None),
-            ]
             validation_results = []
             all_passed = True
             try:
                 if gen_excel is None:
                     raise ValueError("No Generation Excel file uploaded. Please select and upload the required file before proceeding. Accepted format: .xlsx")
-                df = pd.read_excel(gen_excel)
-                for step_msg, check_fn in validation_steps:
-                    try:
-                        check_fn(df)
+                df = read_uploaded_columns(gen_excel, ["Date & Time", "Day Gen (KWh)"])
+                # 15-min granularity is not checked on uploads (validation_utils.validate_15min_granularity)
+                checks = validation_utils.validate_upload(df, ["Date & Time", "Day Gen (KWh)"], ["Day Gen (KWh)"], "Date & Time", context="Generation")
+                for step_msg, ve in checks:
+                    if ve is None:
                         validation_results.append({"message": step_msg, "status": "passed"})
-                    except Exception as ve:
+                    else:
                         user_tip = (
                             "Tip: Double-check your file for correct columns, missing values, and data format. "
                             "If the error persists, review the sample/template file or contact support."
@@ -302,7 +307,6 @@ elif st.session_state["flow_step"] == 3 and st.session_state.get("validation_pas
                             "error": f"{ve} | {user_tip}"
                         })
                         all_passed = False
-                        break
                 if all_passed:
                     validation_results.append({"message": "✅ All generation data validations passed!", "status": "final_pass"})
                 st.session_state["generation_validation_results"] = validation_results
@@ -370,6 +374,38 @@ elif st.session_state["flow_step"] == 4 and st.session_state.get("validation_pas
     with col1:
 
         if st.button("Run Full Data Processing Workflow"):
+            # Local automation modules (user-provided). Ensure these import paths are correct.
+            # Imported here rather than at module level: only this step uses them, so Steps 1-3 start
+            # without loading the automation and DB modules
+            from automate_consumption_data import (
+                process_hrbr_consumption,
+                split_units_to_hourly,
+                consolidate_units_hourly,
+                add_tod_slot,
+                merge_hourly_to_tod,
+                split_hourly_to_15min,
+                merge_hourly_to_daily,
+            )
+            from automate_generation_data import (
+                merge_inverter_data,
+                aggregate_15min,
+                split_date_time,
+                merge_generation_consumption,
+                aggregate_hourly,
+            )
+            from automate_settlement import (
+                calculate_matched_settlement,
+                add_unit_id,
+                monthly_aggregation,
+                apply_monthly_banking_settlement,
+                calculate_savings_comparison,
+            )
+            # --- DB insertion modules ---
+            from DB.insert_15min_data import insert_15min_data
+            from DB.insert_hourly_data import insert_hourly_data
+            from DB.insert_monthly_banking_settlement import insert_monthly_banking_settlement
+            from DB.insert_monthly_savings import insert_monthly_savings
+
             # --- Show all steps as pending first ---
             processing_steps = [
                 # (Description, function, args, kwargs)
@@ -396,16 +432,13 @@ elif st.session_state["flow_step"] == 4 and st.session_state.get("validation_pas
                     "high_grid_rate_per_kwh": 7.20,
                     "low_grid_rate_per_kwh": 5.95,
                     "renewable_rate_per_kwh": 1.0,
-                    "output_sheet": "monthly_saving"
+                    "output_sheet": "monthly_saving",
+                    "output_file": None,
                 }),
             ]
-            # Create a placeholder for each step
-            step_placeholders = []
-            st.markdown("#### Workflow Progress")
-            for step in processing_steps:
-                ph = st.empty()
-                ph.info(f"⏳ {step[0]} ... Pending")
-                step_placeholders.append(ph)
+            # One status container and progress bar for the whole run, instead of a placeholder per step
+            workflow_status = st.status("Workflow Progress", expanded=True)
+            workflow_progress = workflow_status.progress(0.0)
 
             processing_results = []
             all_passed = True
@@ -421,12 +454,14 @@ elif st.session_state["flow_step"] == 4 and st.session_state.get("validation_pas
                         gen_excel_path = tmpdir_path / f"{gen_type}_Generation_Data_Aug.xlsx"
                         merged_consumption_generation_file = tmpdir_path / "Consumption_Generation_Aug25.xlsx"
                         hourly_merged_file = tmpdir_path / "Consumption_Generation_Aug25_hourly.xlsx"
+                        monthly_saving_file = tmpdir_path / "monthly_saving.xlsx"
 
                         # Patch args for steps that need file paths
                         # Save HRBR
                         processing_steps[0][2][1:] = [hrbr_path]
-                        # Process HRBR
+                        # Process HRBR (reusing the frame parsed during validation)
                         processing_steps[1][2][0] = str(hrbr_path)
+                        processing_steps[1][3]["df"] = read_uploaded_columns(hrbr_file, ["DateTime", "Consumption"])
                         # Split units to hourly
                         processing_steps[2][2][0] = str(hrbr_path)
                         processing_steps[2][2][1] = str(hourly_units_file)
@@ -464,35 +499,91 @@ elif st.session_state["flow_step"] == 4 and st.session_state.get("validation_pas
                         processing_steps[16][2][0] = str(merged_consumption_generation_file)
                         # Savings Comparison
                         processing_steps[17][3]["input_file"] = str(merged_consumption_generation_file)
+                        processing_steps[17][3]["output_file"] = str(monthly_saving_file)
+
+                        # Run each step and update UI in real-time.
+                        # Steps 0-7 (consumption) and 8-10 (generation) read and write different
+                        # files, so the two chains run side by side in worker threads; merging
+                        # generation and consumption (step 11) onwards waits for both. Only this
+                        # thread touches the status container: the workers report through a queue.
+                        parallel_lanes = [range(0, 8), range(8, 11)]
+                        step_events = queue.Queue()
+                        stop_lanes = threading.Event()
+                        step_errors = {}
+                        user_tip = (
+                            "Tip: Please check the input files and formats. "
+                            "If the error persists, contact support."
+                        )
 
-                        # Run each step and update UI in real-time
-                        for idx, step in enumerate(processing_steps):
-                            step_msg, fn, args, kwargs = step
-                            try:
-                                fn(*args, **kwargs)
-                                step_placeholders[idx].success(f"✅ {step_msg} Passed.")
-                                processing_results.append({"message": step_msg, "status": "passed"})
-                            except Exception as e:
-                                user_tip = (
-                                    "Tip: Please check the input files and formats. "
-                                    "If the error persists, contact support."
-                                )
-                                step_placeholders[idx].error(
+                        def run_lane(lane):
+                            for lane_idx in lane:
+                                if stop_lanes.is_set():
+                                    return
+                                _, lane_fn, lane_args, lane_kwargs = processing_steps[lane_idx]
+                                try:
+                                    lane_fn(*lane_args, **lane_kwargs)
+                                except Exception as lane_error:
+                                    stop_lanes.set()
+                                    step_events.put((lane_idx, lane_error))
+                                    return
+                                step_events.put((lane_idx, None))
+
+                        def report_step(idx, error):
+                            step_msg = processing_steps[idx][0]
+                            step_errors[idx] = error
+                            workflow_progress.progress(len(step_errors) / len(processing_steps))
+                            if error is None:
+                                workflow_status.write(f"✅ {step_msg} Passed.")
+                            else:
+                                workflow_status.error(
                                     f"❌ {step_msg} Failed!\n\n"
-                                    f"**Details:** {e} | {user_tip}"
+                                    f"**Details:** {error} | {user_tip}"
                                 )
+
+                        # Stages hand their sheets to the next stage in memory; the workbooks are
+                        # saved when the block exits, before anything below reads them
+                        with sheet_cache():
+                            with ThreadPoolExecutor(max_workers=len(parallel_lanes)) as executor:
+                                # copy_context() lets the lanes share the sheet_cache() block of this run
+                                lane_futures = [executor.submit(contextvars.copy_context().run, run_lane, lane) for lane in parallel_lanes]
+                                while not (all(f.done() for f in lane_futures) and step_events.empty()):
+                                    try:
+                                        report_step(*step_events.get(timeout=0.1))
+                                    except queue.Empty:
+                                        pass
+
+                            for idx in range(parallel_lanes[-1][-1] + 1, len(processing_steps)):
+                                if stop_lanes.is_set():
+                                    break
+                                step_msg, fn, args, kwargs = processing_steps[idx]
+                                try:
+                                    fn(*args, **kwargs)
+                                    report_step(idx, None)
+                                except Exception as e:
+                                    report_step(idx, e)
+                                    stop_lanes.set()
+
+                        # Collect results in step order; steps after a failure are listed as not run
+                        not_run = [step[0] for idx, step in enumerate(processing_steps) if idx not in step_errors]
+                        if not_run:
+                            workflow_status.warning("⚠️ Not Run: " + ", ".join(not_run))
+                        for idx, step in enumerate(processing_steps):
+                            step_msg = step[0]
+                            if idx not in step_errors:
+                                continue
+                            elif step_errors[idx] is None:
+                                processing_results.append({"message": step_msg, "status": "passed"})
+                            else:
                                 processing_results.append({
                                     "message": step_msg,
                                     "status": "failed",
-                                    "error": f"{e} | {user_tip}"
+                                    "error": f"{step_errors[idx]} | {user_tip}"
                                 })
                                 all_passed = False
-                                # Mark remaining steps as not run
-                                for j in range(idx + 1, len(processing_steps)):
-                                    step_placeholders[j].warning(f"⚠️ {processing_steps[j][0]} Not Run.")
-                                break
-                            # Optional: add a small delay for better UX
-                            # _time.sleep(0.2)
+                        workflow_status.update(
+                            label="Workflow completed" if all_passed else "Workflow failed",
+                            state="complete" if all_passed else "error",
+                        )
 
                         st.session_state["processing_results"] = processing_results
                         st.session_state["processing_ready"] = True
@@ -534,27 +625,12 @@ elif st.session_state["flow_step"] == 4 and st.session_state.get("validation_pas
                             if merged_consumption_generation_file.exists():
                                 with open(merged_consumption_generation_file, "rb") as f:
                                     st.download_button("Download Consumption-Generation Excel", f, file_name=merged_consumption_generation_file.name)
-                                # Download monthly_saving
-                                import openpyxl
-                                try:
-                                    wb = openpyxl.load_workbook(str(merged_consumption_generation_file), read_only=True)
-                                    if "monthly_saving" in wb.sheetnames:
-                                        # Save monthly_saving to a temp file for download
-                                        monthly_saving_file = tmpdir_path / "monthly_saving.xlsx"
-                                        df_monthly_saving = pd.read_excel(merged_consumption_generation_file, sheet_name="monthly_saving")
-                                        df_monthly_saving.to_excel(monthly_saving_file, index=False)
-                                        with open(monthly_saving_file, "rb") as f2:
-                                            st.download_button("Download Monthly Saving Excel", f2, file_name=monthly_saving_file.name)
-                                    wb.close()
-                                except Exception as e:
-                                    st.warning(
-                                        f"⚠️ **Could not prepare monthly_saving download.**\n\n"
-                                        f"**Details:** {e}\n\n"
-                                        "Please check if the 'monthly_saving' sheet exists in the file. If the issue persists, contact support."
-                                    )
+                            # Download monthly_saving (written as its own workbook by calculate_savings_comparison)
+                            if monthly_saving_file.exists():
+                                with open(monthly_saving_file, "rb") as f:
+                                    st.download_button("Download Monthly Saving Excel", f, file_name=monthly_saving_file.name)
 
                             # --- Save all files to a project folder ---
-                            import shutil
                             import time
 
                             # Create a unique project folder name
@@ -578,9 +654,10 @@ elif st.session_state["flow_step"] == 4 and st.session_state.get("validation_pas
                                 st.write(file_path.name)
 
                             # Copy all files created in tmpdir_path to project_folder
+                            # (not the Parquet sheet copies, which only serve the pipeline stages)
                             for file_path in tmpdir_path.glob("*"):
-                                if file_path.is_file():
-                                    shutil.copy(file_path, project_folder / file_path.name)
+                                if file_path.is_file() and file_path.suffix != ".parquet":
+                                    link_or_copy(file_path, project_folder / file_path.name)
 
                             # DEBUG: List all files in project_folder after copying
                             st.write("Files in project_folder after copy:")
@@ -589,7 +666,13 @@ elif st.session_state["flow_step"] == 4 and st.session_state.get("validation_pas
 
                             # Optionally, zip the project folder and provide a download link
                             zip_path = project_folder.with_suffix(".zip")
-                            shutil.make_archive(str(project_folder), 'zip', root_dir=project_folder)
+                            # xlsx files are already deflated zips, so they are stored as-is rather than
+                            # compressed a second time; anything else gets the fastest deflate level
+                            with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+                                for file_path in sorted(project_folder.glob("*")):
+                                    if file_path.is_file():
+                                        compress_type = zipfile.ZIP_STORED if file_path.suffix == ".xlsx" else zipfile.ZIP_DEFLATED
+                                        zf.write(file_path, arcname=file_path.name, compress_type=compress_type)
 
                             st.info(f"All uploaded and generated files have been saved to: {project_folder.resolve()}")
                             with open(zip_path, "rb") as f:
@@ -599,44 +682,55 @@ elif st.session_state["flow_step"] == 4 and st.session_state.get("validation_pas
                             st.markdown("### Database Insertion")
                             db_status = st.empty()
                             db_results = []
+                            # The loaders get their sheets passed in: the 15-min and banking loaders
+                            # share one parse of the merged workbook, and nothing is cached next to
+                            # the deliverables of this run's fresh folder
+                            merged_sheets = {}
                             try:
-                                db_status.info("Inserting 15-min data into database...")
-                                insert_15min_data(
-                                    excel_path=str(project_folder / "Consumption_Generation_Aug25.xlsx"),
-                                    sheet_name="15 mins",
-                                    location_units_path="location_units.json"
+                                merged_sheets = read_excel(
+                                    str(project_folder / "Consumption_Generation_Aug25.xlsx"),
+                                    sheet_name=["15 mins", "banking_settlement"],
                                 )
-                                db_results.append("✅ 15-min data inserted successfully.")
-                            except Exception as e:
-                                db_results.append(f"❌ 15-min data insertion failed: {e}")
-
-                            try:
-                                db_status.info("Inserting hourly data into database...")
-                                insert_hourly_data(
-                                    excel_path=str(project_folder / "Consumption_Generation_Aug25_hourly.xlsx")
-                                )
-                                db_results.append("✅ Hourly data inserted successfully.")
-                            except Exception as e:
-                                db_results.append(f"❌ Hourly data insertion failed: {e}")
-
-                            try:
-                                db_status.info("Inserting monthly banking settlement data into database...")
-                                insert_monthly_banking_settlement(
-                                    excel_path=str(project_folder / "Consumption_Generation_Aug25.xlsx"),
-                                    sheet_name="banking_settlement"
-                                )
-                                db_results.append("✅ Monthly banking settlement data inserted successfully.")
-                            except Exception as e:
-                                db_results.append(f"❌ Monthly banking settlement data insertion failed: {e}")
-
-                            try:
-                                db_status.info("Inserting monthly savings data into database...")
-                                insert_monthly_savings(
-                                    excel_path=str(project_folder / "monthly_saving.xlsx")
-                                )
-                                db_results.append("✅ Monthly savings data inserted successfully.")
-                            except Exception as e:
-                                db_results.append(f"❌ Monthly savings data insertion failed: {e}")
+                            except Exception:
+                                logger.exception("Could not pre-load Consumption_Generation_Aug25.xlsx; loaders will read it themselves")
+                            single_sheets = {}
+                            for file_name in ("Consumption_Generation_Aug25_hourly.xlsx", "monthly_saving.xlsx"):
+                                try:
+                                    single_sheets[file_name] = read_excel(str(project_folder / file_name))
+                                except Exception:
+                                    logger.exception("Could not pre-load %s; its loader will read it itself", file_name)
+                            # The loaders write to different tables and each borrows its own pooled
+                            # connection, so they run concurrently
+                            db_jobs = [
+                                ("15-min data", insert_15min_data, {
+                                    "excel_path": str(project_folder / "Consumption_Generation_Aug25.xlsx"),
+                                    "sheet_name": "15 mins",
+                                    "location_units_path": "location_units.json",
+                                    "df": merged_sheets.get("15 mins"),
+                                }),
+                                ("Hourly data", insert_hourly_data, {
+                                    "excel_path": str(project_folder / "Consumption_Generation_Aug25_hourly.xlsx"),
+                                    "df": single_sheets.get("Consumption_Generation_Aug25_hourly.xlsx"),
+                                }),
+                                ("Monthly banking settlement data", insert_monthly_banking_settlement, {
+                                    "excel_path": str(project_folder / "Consumption_Generation_Aug25.xlsx"),
+                                    "sheet_name": "banking_settlement",
+                                    "df": merged_sheets.get("banking_settlement"),
+                                }),
+                                ("Monthly savings data", insert_monthly_savings, {
+                                    "excel_path": str(project_folder / "monthly_saving.xlsx"),
+                                    "df": single_sheets.get("monthly_saving.xlsx"),
+                                }),
+                            ]
+                            db_status.info("Inserting data into database...")
+                            with ThreadPoolExecutor(max_workers=len(db_jobs)) as executor:
+                                db_futures = [executor.submit(fn, **kwargs) for _, fn, kwargs in db_jobs]
+                            for (label, _, _), future in zip(db_jobs, db_futures):
+                                try:
+                                    future.result()
+                                    db_results.append(f"✅ {label} inserted successfully.")
+                                except Exception as e:
+                                    db_results.append(f"❌ {label} insertion failed: {e}")
 
                             db_status.empty()
                             for msg in db_results:
@@ -649,6 +743,7 @@ elif st.session_state["flow_step"] == 4 and st.session_state.get("validation_pas
 
             except Exception as e:
                 logger.exception("Processing failed")
+                workflow_status.update(label="Workflow failed", state="error")
                 processing_results.append({
                     "message": "Processing failed",
                     "status": "failed",
@@ -1,5 +1,28 @@
 import pandas as pd
-import os
+import numpy as np
+from excel_utils import EXCEL_WRITE_ENGINE
+
+BILL_COLUMNS = [
+    "Bill headers", "Unit", "Month & Year", "Tariff", "kWh/kW",
+    "Cost without solar", "Cost with Solar wheeling",
+    "DISCOM Bill", "Savings (C-D)"
+]
+
+BILL_HEADERS = [
+    "Total Consumption", "Wheeling Energy", "Energy Charges", "Demand Charges – Fixed",
+    "Fuel Cost Adjustment Charges - Fixed", "Tax – Fixed", "P&G Surcharge – Fixed",
+    "Manual Wheeling Energy Charge - Fixed", "Manual Energy Charges – Fixed ( Wheeling)",
+    "Net Payable"
+]
+
+# Bill lines that add up to the Net Payable of each cost column, in line-item order:
+# Total Consumption, Wheeling Energy, Energy, Demand, Fuel Cost Adjustment, Tax, P&G Surcharge,
+# Manual Wheeling Energy, Manual Energy
+NET_PAYABLE_LINES = np.array([
+    [1, 0, 0, 1, 1, 1, 1, 0, 0],  # Cost without solar
+    [0, 1, 1, 1, 1, 1, 1, 1, 1],  # Cost with Solar wheeling
+    [0, 0, 1, 1, 1, 1, 1, 1, 1],  # DISCOM Bill
+], dtype=float)
 
 def calculate_discom_bill(
         unit, 
@@ -17,6 +40,18 @@ def calculate_discom_bill(
         manual_energy_charge_tariff,
         output_file="discom_bill_aug.xlsx"
     ):
+    # unit, grid_cost_rate, total_consumption, with_banking_consumption, demand_charges_tariff and
+    # demand_charges_kwh may be scalars or equal-length sequences (one entry per unit); every
+    # line item is then computed for all units at once and output_file is written once, with
+    # the ten bill rows of each unit in unit order. Cells without a value ("-" in the
+    # workbook) are NaN in the returned DataFrame.
+    unit = np.atleast_1d(np.asarray(unit, dtype=object))
+    grid_cost_rate = np.asarray(grid_cost_rate, dtype=float)
+    total_consumption = np.asarray(total_consumption, dtype=float)
+    with_banking_consumption = np.asarray(with_banking_consumption, dtype=float)
+    demand_charges_tariff = np.asarray(demand_charges_tariff, dtype=float)
+    demand_charges_kwh = np.asarray(demand_charges_kwh, dtype=float)
+
     # ------------------- Total Consumption-------------------------
     total_consumption_tariff = grid_cost_rate
     total_consumption_kwh = total_consumption
@@ -81,61 +116,41 @@ def calculate_discom_bill(
     manual_energy_charge_discom_bill = manual_energy_charge_cost_with_solar 
     manual_energy_charge_saving = 0
     
+    # ---------------- Bill lines ----------------
+    # Numeric cells of each line, in BILL_COLUMNS order from "Tariff" on; NaN where the bill
+    # shows "-". Scalars are broadcast over the units.
+    lines = [
+        [total_consumption_tariff, total_consumption_kwh, total_consumption_cost_wo_solar, total_consumption_cost_with_solar, total_consumption_discom_bill, total_consumption_saving],
+        [wheeling_energy_with_banking_tariff, wheeling_energy_with_banking_kwh, wheeling_energy_with_banking_cost_wo_solar, wheeling_energy_with_banking_cost_with_solar, wheeling_energy_with_banking_discom_bill, wheeling_energy_with_banking_saving],
+        [energy_charges_tariff, energy_charges_kwh, energy_charges_cost_wo_solar, energy_charges_cost_with_solar, energy_charges_discom_bill, energy_charges_saving],
+        [demand_charges_tariff, demand_charges_kwh, demand_charges_cost_wo_solar, demand_charges_cost_with_solar, demand_charges_discom_bill, demand_charges_saving],
+        [fuel_cost_adj_charges_tariff, fuel_cost_adj_charges_kwh, fuel_cost_adj_charges_cost_wo_solar, fuel_cost_adj_charges_cost_with_solar, fuel_cost_adj_charges_discom, fuel_cost_adj_charges_saving],
+        [tax_tariff, np.nan, tax_cost_wo_solar, tax_cost_with_solar, tax_discom_bill, tax_tariff_saving],
+        [PandG_surcharge_tariff, PandG_surcharge_kwh, PandG_surcharge_cost_wo_solar, PandG_surcharge_cost_with_solar, PandG_surcharge_discom_bill, PandG_surcharge_saving],
+        [manual_wheeling_energy_charge_tariff, manual_wheeling_energy_charge_kwh, manual_wheeling_energy_charge_cost_wo_solar, manual_wheeling_energy_charge_cost_with_solar, manual_wheeling_energy_charge_discom_bill, manual_wheeling_energy_charge_saving],
+        [manual_energy_charge_tariff, manual_energy_charge_kwh, manual_energy_charge_cost_wo_solar, manual_energy_charge_cost_with_solar, manual_energy_charge_discom_bill, manual_energy_charge_saving],
+    ]
+    # (bill line, column, unit); the last line is the Net Payable
+    values = np.empty((len(BILL_HEADERS), len(BILL_COLUMNS) - 3, len(unit)))
+    for i, line in enumerate(lines):
+        for j, value in enumerate(line):
+            values[i, j] = value
+
     # ----------------- Net Payable ---------------------
-    net_payable_cost_wo_solar = sum([
-        demand_charges_cost_wo_solar,
-        fuel_cost_adj_charges_cost_wo_solar,
-        PandG_surcharge_cost_wo_solar,
-        tax_cost_wo_solar,
-        total_consumption_cost_wo_solar
-    ])
-    net_payable_cost_with_solar = sum([
-        demand_charges_cost_with_solar,
-        fuel_cost_adj_charges_cost_with_solar,
-        PandG_surcharge_cost_with_solar,
-        tax_cost_with_solar,
-        energy_charges_cost_with_solar,
-        wheeling_energy_with_banking_cost_with_solar,
-        manual_energy_charge_cost_with_solar,
-        manual_wheeling_energy_charge_cost_with_solar
-    ])
-    net_payable_discom_bill = sum([
-        demand_charges_discom_bill,
-        fuel_cost_adj_charges_discom,
-        PandG_surcharge_discom_bill,
-        tax_discom_bill,
-        energy_charges_discom_bill,
-        manual_energy_charge_discom_bill,
-        manual_wheeling_energy_charge_discom_bill
-    ])
-    net_payable_saving = net_payable_cost_wo_solar - net_payable_cost_with_solar
+    net_payable = np.einsum("ck,kcn->cn", NET_PAYABLE_LINES, values[:-1, 2:5])
+    values[-1, :2] = np.nan
+    values[-1, 2:5] = net_payable
+    values[-1, 5] = net_payable[0] - net_payable[1]
 
     # ---------------- Build DataFrame ----------------
-    data = [
-        ["Total Consumption", unit, month, total_consumption_tariff, total_consumption_kwh, total_consumption_cost_wo_solar, total_consumption_cost_with_solar, total_consumption_discom_bill, total_consumption_saving],
-        ["Wheeling Energy", unit, month, wheeling_energy_with_banking_tariff, wheeling_energy_with_banking_kwh, wheeling_energy_with_banking_cost_wo_solar, wheeling_energy_with_banking_cost_with_solar, wheeling_energy_with_banking_discom_bill, wheeling_energy_with_banking_saving],
-        ["Energy Charges", unit, month, energy_charges_tariff, energy_charges_kwh, energy_charges_cost_wo_solar, energy_charges_cost_with_solar, energy_charges_discom_bill, energy_charges_saving],
-        ["Demand Charges – Fixed", unit, month, demand_charges_tariff, demand_charges_kwh, demand_charges_cost_wo_solar, demand_charges_cost_with_solar, demand_charges_discom_bill, demand_charges_saving],
-        ["Fuel Cost Adjustment Charges - Fixed", unit, month, fuel_cost_adj_charges_tariff, fuel_cost_adj_charges_kwh, fuel_cost_adj_charges_cost_wo_solar, fuel_cost_adj_charges_cost_with_solar, fuel_cost_adj_charges_discom, fuel_cost_adj_charges_saving],
-        ["Tax – Fixed", unit, month, tax_tariff, "-", tax_cost_wo_solar, tax_cost_with_solar, tax_discom_bill, tax_tariff_saving],
-        ["P&G Surcharge – Fixed", unit, month, PandG_surcharge_tariff, PandG_surcharge_kwh, PandG_surcharge_cost_wo_solar, PandG_surcharge_cost_with_solar, PandG_surcharge_discom_bill, PandG_surcharge_saving],
-        ["Manual Wheeling Energy Charge - Fixed", unit, month, manual_wheeling_energy_charge_tariff, manual_wheeling_energy_charge_kwh, manual_wheeling_energy_charge_cost_wo_solar, manual_wheeling_energy_charge_cost_with_solar, manual_wheeling_energy_charge_discom_bill, manual_wheeling_energy_charge_saving],
-        ["Manual Energy Charges – Fixed ( Wheeling)", unit, month, manual_energy_charge_tariff, manual_energy_charge_kwh, manual_energy_charge_cost_wo_solar, manual_energy_charge_cost_with_solar, manual_energy_charge_discom_bill, manual_energy_charge_saving],
-        ["Net Payable", unit, month, "-", "-", net_payable_cost_wo_solar, net_payable_cost_with_solar, net_payable_discom_bill, net_payable_saving]
-    ]
-    df = pd.DataFrame(data, columns=[
-        "Bill headers", "Unit", "Month & Year", "Tariff", "kWh/kW", 
-        "Cost without solar", "Cost with Solar wheeling", 
-        "DISCOM Bill", "Savings (C-D)"
-    ])
+    # One float block, ten rows per unit in unit order, plus the three label columns
+    df = pd.DataFrame(values.transpose(2, 0, 1).reshape(-1, values.shape[1]), columns=BILL_COLUMNS[3:])
+    df.insert(0, "Bill headers", np.tile(BILL_HEADERS, len(unit)))
+    df.insert(1, "Unit", np.repeat(unit, len(BILL_HEADERS)))
+    df.insert(2, "Month & Year", month)
 
-    # ---------------- Save or Append to Excel ----------------
-    if os.path.exists(output_file):
-        existing_df = pd.read_excel(output_file)
-        final_df = pd.concat([existing_df, df], ignore_index=True)
-    else:
-        final_df = df
-    final_df.to_excel(output_file, index=False)
+    # ---------------- Save to Excel ----------------
+    df.to_excel(output_file, index=False, na_rep="-", engine=EXCEL_WRITE_ENGINE)
     return df
 
 def run_billing_automation():
@@ -160,23 +175,26 @@ def run_billing_automation():
         ("KANAKAPURA (S12HT-99)", 5.95, 45733.521, 38480, 370, 135),
         ("ELECTRONIC CITY (S13HT-87)", 5.95, 69740, 62322, 370, 180),
     ]
-    for unit, grid_cost_rate, total_consumption, with_banking_consumption, demand_charges_tariff, demand_charges_kwh in units_data:
-        calculate_discom_bill(
-            unit,
-            month,
-            grid_cost_rate,
-            renewable_cost_rate,
-            total_consumption,
-            with_banking_consumption,
-            demand_charges_tariff,
-            demand_charges_kwh,
-            fuel_cost_adj_charges_tariff,
-            tax_tariff,
-            PandG_surcharge_tariff,
-            manual_wheeling_energy_charge_tariff,
-            manual_energy_charge_tariff,
-            output_file="discom_bill_aug.xlsx"
-        )
+    units_df = pd.DataFrame(units_data, columns=[
+        "unit", "grid_cost_rate", "total_consumption",
+        "with_banking_consumption", "demand_charges_tariff", "demand_charges_kwh"
+    ])
+    calculate_discom_bill(
+        units_df["unit"],
+        month,
+        units_df["grid_cost_rate"],
+        renewable_cost_rate,
+        units_df["total_consumption"],
+        units_df["with_banking_consumption"],
+        units_df["demand_charges_tariff"],
+        units_df["demand_charges_kwh"],
+        fuel_cost_adj_charges_tariff,
+        tax_tariff,
+        PandG_surcharge_tariff,
+        manual_wheeling_energy_charge_tariff,
+        manual_energy_charge_tariff,
+        output_file="discom_bill_aug.xlsx"
+    )
 
 if __name__ == "__main__":
     run_billing_automation()
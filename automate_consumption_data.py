@@ -14,6 +14,8 @@ Steps:
 import pandas as pd
 import numpy as np
 from openpyxl import load_workbook
+from excel_utils import read_excel, read_sheet, read_workbook, sheet_cache, write_sheet, write_sheets
+from numba_utils import njit
 from validation_utils import (
     validate_columns,
     validate_no_nans,
@@ -26,13 +28,16 @@ from validation_utils import (
     validate_nonempty,
 )
 
-def process_hrbr_consumption(input_file):
+def process_hrbr_consumption(input_file, df=None):
     # Step 1: Process consumption data of HRBR Unit
+    # df: the already-parsed HRBR sheet, if the caller has it; the result is still written to input_file
     validate_file_exists(input_file)
-    df = pd.read_excel(input_file)
+    if df is None:
+        df = read_excel(input_file)
     validate_columns(df, ['DateTime', 'Consumption'], context="HRBR input")
-    # Clean up: treat empty strings/whitespace as NaN in 'Consumption'
-    df['Consumption'] = df['Consumption'].replace(r'^\s*$', np.nan, regex=True)
+    # Clean up: treat empty strings/whitespace (or any other non-numeric text) as NaN in 'Consumption';
+    # a vectorised parse instead of a regex over every cell, and a no-op on an already numeric column
+    df['Consumption'] = pd.to_numeric(df['Consumption'], errors='coerce')
     validate_no_nans(df, ['DateTime', 'Consumption'], context="HRBR input")
     validate_positive_values(df, ['Consumption'], context="HRBR input")
     df['DateTime'] = pd.to_datetime(df['DateTime'])
@@ -41,65 +46,81 @@ def process_hrbr_consumption(input_file):
     total_consumption = df['Consumption'].sum()
     df['Consumption_%'] = ((df['Consumption'] / total_consumption) * 100).round(2)
     validate_percentage_sum(df, 'Consumption_%', expected_sum=100, tolerance=1, context="HRBR With_Percentages")
-    with pd.ExcelWriter(input_file, mode='a', if_sheet_exists='replace', engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='With_Percentages', index=False)
+    write_sheet(df, input_file, 'With_Percentages')
+
+@njit(cache=True)
+def hourly_shares(hourly_percentages):
+    # Share of the monthly value that falls in each hour.
+    # hourly_percentages: float64 ndarray. float64 on purpose: these values go into the
+    # workbooks and the DB as reported kWh, and float32 keeps only ~7 significant digits
+    # (48359.985 would become 48359.984)
+    total_pct = 0.0
+    for i in range(hourly_percentages.shape[0]):
+        total_pct += hourly_percentages[i]
+    shares = np.empty_like(hourly_percentages)
+    for i in range(hourly_percentages.shape[0]):
+        shares[i] = hourly_percentages[i] / total_pct
+    return shares
 
 def split_monthly_to_hourly(total_value, hourly_percentages):
-    hourly_percentages = np.array(hourly_percentages, dtype=float)
-    normalized = hourly_percentages / hourly_percentages.sum()
-    hourly_values = normalized * total_value
-    return hourly_values
+    # hourly_shares needs a float64 array; callers may pass a list, a Series or integer percentages
+    return hourly_shares(np.asarray(hourly_percentages, dtype=np.float64)) * total_value
 
 def split_units_to_hourly(input_file, output_file, unit_values):
     # Step 2: Split consumption value of all units into hourly
     validate_file_exists(input_file)
     validate_sheet_exists(input_file, "With_Percentages")
-    df = pd.read_excel(input_file, sheet_name="With_Percentages")
-    validate_columns(df, ["Consumption_%"], context="With_Percentages")
+    df = read_sheet(input_file, "With_Percentages", usecols=["DateTime", "Consumption_%"])
+    validate_columns(df, ["DateTime", "Consumption_%"], context="With_Percentages")
     validate_no_nans(df, ["Consumption_%"], context="With_Percentages")
-    dates = pd.to_datetime(df.iloc[:, 0])
-    hourly_percentages = df["Consumption_%"].tolist()
+    dates = pd.to_datetime(df["DateTime"])
+    hourly_percentages = df["Consumption_%"].to_numpy(dtype=np.float64)
     zero_slots = pd.to_datetime([
         "2025-08-07 18:00:02",
         "2025-08-07 19:00:02",
         "2025-08-07 20:00:02"
     ])
-    with pd.ExcelWriter(output_file, engine="openpyxl") as writer:
-        for unit, total_value in unit_values.items():
-            hourly_values = split_monthly_to_hourly(total_value, hourly_percentages)
-            if unit.lower() == "hrbr unit":
-                mask = dates.isin(zero_slots)
-                hourly_values = pd.Series(hourly_values)
-                hourly_values.loc[mask] = 0
-            unit_df = pd.DataFrame({
-                "Date": dates,
-                "Consumption": hourly_values
-            })
-            unit_df.to_excel(writer, sheet_name=unit, index=False)
+    # The percentages are the same for every unit, so they are normalised once
+    shares = hourly_shares(hourly_percentages)
+    zero_mask = dates.isin(zero_slots).to_numpy()
+    # One sheet per unit, all saved in one writer; inside sheet_cache() consolidate_units_hourly
+    # takes them from memory
+    unit_frames = {}
+    for unit, total_value in unit_values.items():
+        hourly_values = shares * total_value
+        if unit.lower() == "hrbr unit":
+            hourly_values[zero_mask] = 0
+        unit_frames[unit] = pd.DataFrame({
+            "Date": dates,
+            "Consumption": hourly_values
+        })
+    write_sheets(unit_frames, output_file)
 
 def consolidate_units_hourly(input_file, output_file):
     # Step 3: Consolidate all units (hourly)
     validate_file_exists(input_file)
-    sheets_dict = pd.read_excel(input_file, sheet_name=None)
-    merged_df = pd.DataFrame()
+    sheets_dict = read_workbook(input_file)
+    frames = []
     for sheet_name, df in sheets_dict.items():
         if "Date" in df.columns and "Consumption" in df.columns:
             df["Unit"] = sheet_name
-            df["DateTime"] = pd.to_datetime(df["Date"])
-            df["Date"] = df["DateTime"].dt.date
-            df["Time"] = df["DateTime"].dt.strftime("%H:00:00")
-            df = df.drop(columns=["DateTime"])
-            merged_df = pd.concat([merged_df, df], ignore_index=True)
-    merged_df.to_excel(output_file, sheet_name="hourly", index=False)
+            date_time = pd.to_datetime(df["Date"])
+            df["Date"] = date_time.dt.date
+            df["Time"] = date_time.dt.strftime("%H:00:00")
+            # Kept as a real datetime column, so later steps need not rebuild it from Date and Time
+            df["DateTime"] = date_time.dt.floor("h")
+            frames.append(df)
+    # One concat for all units instead of re-copying the growing frame for every sheet
+    merged_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    write_sheet(merged_df, output_file, "hourly", mode="w")
 
 def add_tod_slot(input_file):
     # Step 4: Add ToD slot column into hourly data
     validate_file_exists(input_file)
     validate_sheet_exists(input_file, "hourly")
-    df = pd.read_excel(input_file, sheet_name="hourly")
-    validate_columns(df, ["Date", "Time", "Consumption", "Unit"], context="hourly")
-    validate_no_nans(df, ["Date", "Time", "Consumption"], context="hourly")
-    df["DateTime"] = pd.to_datetime(df["Date"].astype(str) + " " + df["Time"].astype(str))
+    df = read_sheet(input_file, "hourly")
+    validate_columns(df, ["DateTime", "Consumption", "Unit"], context="hourly")
+    validate_no_nans(df, ["DateTime", "Consumption"], context="hourly")
     df["Hour"] = df["DateTime"].dt.hour
     df["Date"] = df["DateTime"].dt.date
     def get_tod_slot(hour):
@@ -113,20 +134,22 @@ def add_tod_slot(input_file):
             return "Evening Peak"
         else:
             return None
-    df["ToD_Slot"] = df["Hour"].apply(get_tod_slot)
-    with pd.ExcelWriter(input_file, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
-        df.to_excel(writer, sheet_name="hourly1", index=False)
+    # get_tod_slot evaluated once per hour of the day, then looked up by hour for every row
+    tod_by_hour = np.array([get_tod_slot(hour) for hour in range(24)], dtype=object)
+    df["ToD_Slot"] = tod_by_hour[df["Hour"].to_numpy()]
+    write_sheet(df, input_file, "hourly1")
 
 def merge_hourly_to_tod(input_file):
     # Step 5: Merge hourly data to ToD slots
+    # Works on step 4's 'hourly1' sheet, which already carries the parsed DateTime and Hour,
+    # so the hourly data is parsed once for both steps
     validate_file_exists(input_file)
-    validate_sheet_exists(input_file, "hourly")
-    df = pd.read_excel(input_file, sheet_name="hourly")
-    validate_columns(df, ["Date", "Time", "Consumption", "Unit"], context="hourly")
-    validate_no_nans(df, ["Date", "Time", "Consumption"], context="hourly")
-    df["DateTime"] = pd.to_datetime(df["Date"].astype(str) + " " + df["Time"].astype(str))
-    df["Hour"] = df["DateTime"].dt.hour
-    df["Date"] = df["DateTime"].dt.date
+    validate_sheet_exists(input_file, "hourly1")
+    df = read_sheet(input_file, "hourly1")
+    validate_columns(df, ["DateTime", "Hour", "Consumption", "Unit"], context="hourly1")
+    validate_no_nans(df, ["DateTime", "Hour", "Consumption"], context="hourly1")
+    # Not the slot boundaries of add_tod_slot: here Morning Peak runs 06-10 and Day Normal 10-18
+    # (as in the original notebook), so ToD_Slot is recomputed rather than taken from hourly1
     def get_tod_slot(hour):
         if 22 <= hour <= 23 or 0 <= hour < 6:
             return "Night Off Peak"
@@ -138,73 +161,65 @@ def merge_hourly_to_tod(input_file):
             return "Evening Peak"
         else:
             return None
-    def get_time_range(tod_slot):
-        time_ranges = {
-            "Night Off Peak": "22:00 - 06:00",
-            "Morning Peak": "06:00 - 09:00",
-            "Day Normal": "09:00 - 18:00",
-            "Evening Peak": "18:00 - 22:00"
-        }
-        return time_ranges.get(tod_slot, None)
-    df["ToD_Slot"] = df["Hour"].apply(get_tod_slot)
-    # Shift 22–23 hours to the NEXT day
-    df_shift = df[df["Hour"].isin([22, 23])].copy()
-    df_shift["Date"] = pd.to_datetime(df_shift["Date"]) + pd.Timedelta(days=1)
-    df_shift["Date"] = df_shift["Date"].dt.date
-    df = df[~df["Hour"].isin([22, 23])]
-    df = pd.concat([df, df_shift], ignore_index=True)
-    first_date = df["Date"].min()
-    last_date = df["Date"].max()
-    mask_last22 = (df["Date"] == last_date) & (df["Hour"].isin([22, 23]))
-    df.loc[mask_last22, "Date"] = first_date
+    time_ranges = {
+        "Night Off Peak": "22:00 - 06:00",
+        "Morning Peak": "06:00 - 09:00",
+        "Day Normal": "09:00 - 18:00",
+        "Evening Peak": "18:00 - 22:00"
+    }
+    # get_tod_slot evaluated once per hour of the day, then looked up by hour for every row
+    tod_by_hour = np.array([get_tod_slot(hour) for hour in range(24)], dtype=object)
+    df["ToD_Slot"] = tod_by_hour[df["Hour"].to_numpy()]
+    # Shift 22–23 hours to the NEXT day, in place; those of the last day wrap to the first day
+    late = df["Hour"].isin([22, 23])
+    day = df["DateTime"].dt.normalize() + pd.to_timedelta(late.astype("int64"), unit="D")
+    day = day.mask(late & (day == day.max()), day.min())
+    # Grouped on the datetime64 day (an integer key) rather than on datetime.date objects;
+    # converted to dates only for the few aggregated rows
+    df["Date"] = day
     tod_df = (
         df.groupby(["Date", "Unit", "ToD_Slot"], as_index=False)["Consumption"]
           .sum()
           .rename(columns={"Consumption": "Value"})
     )
-    tod_df["Time"] = tod_df["ToD_Slot"].apply(get_time_range)
+    tod_df["Date"] = tod_df["Date"].dt.date
+    tod_df["Time"] = tod_df["ToD_Slot"].map(time_ranges)
     column_order = ["Date", "Unit", "ToD_Slot", "Time", "Value"]
     tod_df = tod_df[column_order]
-    with pd.ExcelWriter(input_file, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
-        tod_df.to_excel(writer, sheet_name="ToD", index=False)
+    write_sheet(tod_df, input_file, "ToD")
 
 def split_hourly_to_15min(input_file):
     # Step 6: Split hourly data into 15 mins interval
     validate_file_exists(input_file)
     validate_sheet_exists(input_file, "hourly1")
-    df = pd.read_excel(input_file, sheet_name="hourly1")
-    validate_columns(df, ["Date", "Time", "Consumption", "Unit"], context="hourly1")
-    validate_no_nans(df, ["Date", "Time", "Consumption"], context="hourly1")
-    df["DateTime"] = pd.to_datetime(df["Date"].astype(str) + " " + df["Time"].astype(str))
-    expanded_rows = []
-    for _, row in df.iterrows():
-        base_time = row["DateTime"]
-        consumption_per_15min = row["Consumption"] / 4
-        for i in range(4):
-            new_time = base_time + pd.Timedelta(minutes=15*i)
-            expanded_rows.append({
-                "Date": new_time.date(),
-                "Time": new_time.time(),
-                "Consumption": consumption_per_15min,
-                "Unit": row["Unit"],
-                "ToD_Slot": row['ToD_Slot']
-            })
-    df_15min = pd.DataFrame(expanded_rows)
-    with pd.ExcelWriter(input_file, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
-        df_15min.to_excel(writer, sheet_name="15_mins", index=False)
+    df = read_sheet(input_file, "hourly1")
+    validate_columns(df, ["DateTime", "Consumption", "Unit"], context="hourly1")
+    validate_no_nans(df, ["DateTime", "Consumption"], context="hourly1")
+    # Each hourly row becomes four 15-minute rows carrying a quarter of its consumption
+    df_15min = df.loc[df.index.repeat(4), ["DateTime", "Consumption", "Unit", "ToD_Slot"]].reset_index(drop=True)
+    new_time = df_15min["DateTime"] + pd.to_timedelta(np.tile([0, 15, 30, 45], len(df)), unit="m")
+    df_15min = pd.DataFrame({
+        "Date": new_time.dt.date,
+        "Time": new_time.dt.time,
+        # stays float64, like the hourly values it splits (see hourly_shares)
+        "Consumption": df_15min["Consumption"] / 4,
+        "Unit": df_15min["Unit"],
+        "ToD_Slot": df_15min["ToD_Slot"],
+    })
+    write_sheet(df_15min, input_file, "15_mins")
 
 def merge_hourly_to_daily(input_file):
     # Step 7: Merge hourly data to daily data
     validate_file_exists(input_file)
     validate_sheet_exists(input_file, "hourly")
-    df = pd.read_excel(input_file, sheet_name="hourly")
-    validate_columns(df, ["Date", "Time", "Consumption", "Unit"], context="hourly")
-    validate_no_nans(df, ["Date", "Time", "Consumption"], context="hourly")
-    df["DateTime"] = pd.to_datetime(df["Date"].astype(str) + " " + df["Time"].astype(str))
-    df["Date"] = df["DateTime"].dt.date
+    df = read_sheet(input_file, "hourly")
+    validate_columns(df, ["DateTime", "Consumption", "Unit"], context="hourly")
+    validate_no_nans(df, ["DateTime", "Consumption"], context="hourly")
+    # Grouped on the datetime64 day rather than on datetime.date objects, as in merge_hourly_to_tod
+    df["Date"] = df["DateTime"].dt.normalize()
     df_daily = df.groupby(["Date", "Unit"], as_index=False).agg({"Consumption": "sum"})
-    with pd.ExcelWriter(input_file, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
-        df_daily.to_excel(writer, sheet_name="daily", index=False)
+    df_daily["Date"] = df_daily["Date"].dt.date
+    write_sheet(df_daily, input_file, "daily")
 
 def main():
     hrbr_file = "HRBR Aug.xlsx"
@@ -225,20 +240,21 @@ def main():
         "Old Airport Road": 77528.014,
     }
 
-    print("Step 1: Processing HRBR Unit consumption data...")
-    process_hrbr_consumption(hrbr_file)
-    print("Step 2: Splitting unit values to hourly...")
-    split_units_to_hourly(hrbr_file, hourly_units_file, unit_values)
-    print("Step 3: Consolidating all units (hourly)...")
-    consolidate_units_hourly(hourly_units_file, consolidated_file)
-    print("Step 4: Adding ToD slot column...")
-    add_tod_slot(consolidated_file)
-    print("Step 5: Merging hourly data to ToD slots...")
-    merge_hourly_to_tod(consolidated_file)
-    print("Step 6: Splitting hourly data into 15 min intervals...")
-    split_hourly_to_15min(consolidated_file)
-    print("Step 7: Merging hourly data to daily data...")
-    merge_hourly_to_daily(consolidated_file)
+    with sheet_cache():
+        print("Step 1: Processing HRBR Unit consumption data...")
+        process_hrbr_consumption(hrbr_file)
+        print("Step 2: Splitting unit values to hourly...")
+        split_units_to_hourly(hrbr_file, hourly_units_file, unit_values)
+        print("Step 3: Consolidating all units (hourly)...")
+        consolidate_units_hourly(hourly_units_file, consolidated_file)
+        print("Step 4: Adding ToD slot column...")
+        add_tod_slot(consolidated_file)
+        print("Step 5: Merging hourly data to ToD slots...")
+        merge_hourly_to_tod(consolidated_file)
+        print("Step 6: Splitting hourly data into 15 min intervals...")
+        split_hourly_to_15min(consolidated_file)
+        print("Step 7: Merging hourly data to daily data...")
+        merge_hourly_to_daily(consolidated_file)
     print("✅ All steps completed.")
 
 if __name__ == "__main__":
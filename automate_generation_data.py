@@ -11,9 +11,12 @@ Steps:
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 import warnings
+from excel_utils import EXCEL_WRITE_ENGINE, read_excel, read_sheet, sheet_cache, write_sheet
+from numba_utils import njit
 from validation_utils import (
     validate_columns,
     validate_no_nans,
@@ -26,64 +29,94 @@ from validation_utils import (
     validate_nonempty,
 )
 
-def merge_inverter_data(base_folder, merged_file):
+# Sheet of the merged workbook holding the merged inverter rows (the to_excel default name)
+MERGED_SHEET = "Sheet1"
+
+def _read_inverter_file(file_name, file_path):
+    """
+    Reads one inverter day file. Returns (valid rows with per-interval generation, rows with an
+    invalid Date & Time, rows with a non-numeric Day Gen).
+    """
+    df = read_excel(file_path, header=0)
+    validate_columns(df, ['Date & Time', 'Day Gen (KWh)'], context=file_name)
+    df['Source File'] = file_name
+    df['Date & Time'] = pd.to_datetime(df['Date & Time'], errors='coerce', dayfirst=True)
+    invalid_rows_date = df[df['Date & Time'].isna()]
+    df['Day Gen (KWh)'] = pd.to_numeric(df['Day Gen (KWh)'], errors='coerce')
+    invalid_rows_gen = df[df['Day Gen (KWh)'].isna()]
+    df_valid = df.dropna(subset=['Date & Time', 'Day Gen (KWh)']).copy()
+    validate_positive_values(df_valid, ['Day Gen (KWh)'], context=f"{file_name} valid rows")
+    B = df_valid['Day Gen (KWh)'].values
+    # Each row's generation is its reading minus the next row's; the last row keeps its reading
+    C = np.empty_like(B)
+    np.subtract(B[:-1], B[1:], out=C[:-1])
+    C[-1:] = B[-1:]
+    df_valid['Day Gen (KWh)'] = C
+    return df_valid[['Date & Time', 'Day Gen (KWh)']], invalid_rows_date, invalid_rows_gen
+
+def merge_inverter_data(base_folder, merged_file, max_workers=None):
+    # max_workers: threads reading inverter files (ThreadPoolExecutor's default if None)
     warnings.simplefilter(action='ignore', category=pd.errors.SettingWithCopyWarning)
-    merged_df = pd.DataFrame()
-    invalid_dates_df = pd.DataFrame()
-    invalid_gen_df = pd.DataFrame()
+    # Per-file parts, concatenated once after the loop instead of re-copying the accumulated frames
+    merged_parts = []
+    invalid_date_parts = []
+    invalid_gen_parts = []
 
+    files = []
     for day in range(1, 32):
         day_str = str(day).zfill(2)
         day_folder = os.path.join(base_folder, day_str)
         for i in range(1, 17):
             file_name = f"KIDS_CLINIC__Inverter___INV_{i}(Day Data_{day_str}_08_2025)_.xlsx"
-            file_path = os.path.join(day_folder, file_name)
-            if os.path.exists(file_path):
-                df = pd.read_excel(file_path, header=0)
-                validate_columns(df, ['Date & Time', 'Day Gen (KWh)'], context=file_name)
-                df['Source File'] = file_name
-                df['Date & Time'] = pd.to_datetime(df['Date & Time'], errors='coerce', dayfirst=True)
-                invalid_rows_date = df[df['Date & Time'].isna()]
-                if not invalid_rows_date.empty:
-                    invalid_dates_df = pd.concat([invalid_dates_df, invalid_rows_date], ignore_index=True)
-                df['Day Gen (KWh)'] = pd.to_numeric(df['Day Gen (KWh)'], errors='coerce')
-                invalid_rows_gen = df[df['Day Gen (KWh)'].isna()]
-                if not invalid_rows_gen.empty:
-                    invalid_gen_df = pd.concat([invalid_gen_df, invalid_rows_gen], ignore_index=True)
-                df_valid = df.dropna(subset=['Date & Time', 'Day Gen (KWh)']).copy()
-                validate_positive_values(df_valid, ['Day Gen (KWh)'], context=f"{file_name} valid rows")
-                B = df_valid['Day Gen (KWh)'].values
-                C = np.zeros_like(B)
-                for j in range(len(B)-1):
-                    C[j] = B[j] - B[j+1]
-                C[-1] = B[-1]
-                df_valid['Day Gen (KWh)'] = C
-                df_valid = df_valid[['Date & Time', 'Day Gen (KWh)']]
-                merged_df = pd.concat([merged_df, df_valid], ignore_index=True)
-                print(f"✅ File processed : {file_path}")
-            else:
+            files.append((file_name, os.path.join(day_folder, file_name)))
+
+    def read_if_present(file):
+        return _read_inverter_file(*file) if os.path.exists(file[1]) else None
+
+    # The files are independent, so they are read on a thread pool (overlapping disk reads and
+    # the parts of parsing that leave the GIL); results are combined in day/inverter order
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for (file_name, file_path), result in zip(files, executor.map(read_if_present, files)):
+            if result is None:
                 print(f"⚠️ File not found: {file_path}")
+                continue
+            df_valid, invalid_rows_date, invalid_rows_gen = result
+            if not invalid_rows_date.empty:
+                invalid_date_parts.append(invalid_rows_date)
+            if not invalid_rows_gen.empty:
+                invalid_gen_parts.append(invalid_rows_gen)
+            merged_parts.append(df_valid)
+            print(f"✅ File processed : {file_path}")
+
+    if merged_parts:
+        merged_df = pd.concat(merged_parts, ignore_index=True)
+    else:
+        merged_df = pd.DataFrame(columns=['Date & Time', 'Day Gen (KWh)'])
+    invalid_dates_df = pd.concat(invalid_date_parts, ignore_index=True) if invalid_date_parts else pd.DataFrame()
+    invalid_gen_df = pd.concat(invalid_gen_parts, ignore_index=True) if invalid_gen_parts else pd.DataFrame()
 
     merged_df = merged_df.sort_values('Date & Time').reset_index(drop=True)
     validate_nonempty(merged_df, context="Merged inverter data")
-    merged_df.to_excel(merged_file, index=False)
+    write_sheet(merged_df, merged_file, MERGED_SHEET, mode="w")
     print(f"✅ All valid rows merged into {merged_file}")
 
     # Save merged generation data to a new Excel file for generation only
     generation_file = "Generation_Data_Aug.xlsx"
-    merged_df.to_excel(generation_file, index=False)
+    merged_df.to_excel(generation_file, index=False, engine=EXCEL_WRITE_ENGINE)
     print(f"✅ Generation data also saved to {generation_file}")
 
     if not invalid_dates_df.empty:
-        invalid_dates_df.to_excel(os.path.join(base_folder, "invalid_date_records.xlsx"), index=False)
+        invalid_dates_df.to_excel(os.path.join(base_folder, "invalid_date_records.xlsx"), index=False, engine=EXCEL_WRITE_ENGINE)
         print(f"⚠️ Invalid Date & Time records saved to invalid_date_records.xlsx")
     if not invalid_gen_df.empty:
-        invalid_gen_df.to_excel(os.path.join(base_folder, "invalid_daygen_records.xlsx"), index=False)
+        invalid_gen_df.to_excel(os.path.join(base_folder, "invalid_daygen_records.xlsx"), index=False, engine=EXCEL_WRITE_ENGINE)
         print(f"⚠️ Non-numeric Day Gen records saved to invalid_daygen_records.xlsx")
 
 def aggregate_15min(merged_file):
     validate_file_exists(merged_file)
-    df = pd.read_excel(merged_file)
+    # The app passes the uploaded generation workbook here, which has no copy and whose first
+    # sheet may have any name
+    df = read_sheet(merged_file, MERGED_SHEET, excel_sheet=0)
     validate_columns(df, ['Date & Time', 'Day Gen (KWh)'], context="Merged inverter data")
     validate_no_nans(df, ['Date & Time', 'Day Gen (KWh)'], context="Merged inverter data")
     df['DateTime'] = pd.to_datetime(df['Date & Time'])
@@ -95,97 +128,142 @@ def aggregate_15min(merged_file):
           .reset_index()
     )
     validate_nonempty(df_15min, context="15min aggregated data")
-    with pd.ExcelWriter(merged_file, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-        df_15min.to_excel(writer, sheet_name='15min_Data', index=False)
+    write_sheet(df_15min, merged_file, '15min_Data')
     print("Aggregated 15-minute data saved to sheet '15min_Data'")
 
 def split_date_time(merged_file):
     validate_file_exists(merged_file)
     validate_sheet_exists(merged_file, "15min_Data")
-    df = pd.read_excel(merged_file, sheet_name="15min_Data")
+    df = read_sheet(merged_file, "15min_Data")
     validate_columns(df, ['DateTime', 'Day Gen (KWh)'], context="15min_Data")
     validate_no_nans(df, ['DateTime', 'Day Gen (KWh)'], context="15min_Data")
     df['DateTime'] = pd.to_datetime(df['DateTime'], errors='coerce')
     df['Date'] = df['DateTime'].dt.date
     df['Time'] = df['DateTime'].dt.time
-    with pd.ExcelWriter(merged_file, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-        df.to_excel(writer, sheet_name='15 mins', index=False)
+    write_sheet(df, merged_file, '15 mins')
     print("✅ Data with split Date and Time saved to sheet '15 mins'")
 
+def _slot_start(df):
+    """
+    Start of each row's slot as datetime64: the Date column (datetime64 or date objects) plus
+    the Time column (time objects or "HH:MM:SS" text) as a timedelta, without building and
+    re-parsing "date time" strings.
+    """
+    return pd.to_datetime(df["Date"]).dt.normalize() + pd.to_timedelta(df["Time"].astype(str))
+
+@njit(cache=True)
+def _allocate_generation(slot_bounds, slot_gen, cons, is_priority):
+    """
+    Allocates each slot's generation to its units, in order: every unit takes what it consumes
+    from what the previous ones left. Rows are grouped by slot, slot s spanning
+    slot_bounds[s]:slot_bounds[s + 1]. Once a slot's generation is used up, the remaining
+    priority units get no surplus demand recorded while the other units carry their full
+    consumption as surplus demand.
+    Returns (generation assigned, surplus demand) per row and the generation left per slot.
+    """
+    n = cons.shape[0]
+    n_slots = slot_gen.shape[0]
+    assigned = np.zeros(n)
+    demand = np.zeros(n)
+    leftover = np.zeros(n_slots)
+    for s in range(n_slots):
+        available = slot_gen[s]
+        for i in range(slot_bounds[s], slot_bounds[s + 1]):
+            if available <= 0:
+                if not is_priority[i]:
+                    demand[i] = cons[i]
+                continue
+            a = min(cons[i], available)
+            assigned[i] = a
+            if a < cons[i]:
+                demand[i] = cons[i] - a
+            available -= a
+        leftover[s] = max(available, 0.0)
+    return assigned, demand, leftover
+
 def merge_generation_consumption(merged_file, consumption_file, output_file):
     priority_units = ["MALLESWARAM", "SAHAKAR NAGAR", "HRBR UNIT", "OLD AIRPORT ROAD"]
     validate_file_exists(merged_file)
     validate_sheet_exists(merged_file, "15 mins")
     validate_file_exists(consumption_file)
     validate_sheet_exists(consumption_file, "15_mins")
-    gen_df = pd.read_excel(merged_file, sheet_name="15 mins")
-    cons_df = pd.read_excel(consumption_file, sheet_name="15_mins")
+    gen_df = read_sheet(merged_file, "15 mins")
+    cons_df = read_sheet(consumption_file, "15_mins")
     validate_columns(gen_df, ["Date", "Time", "Day Gen (KWh)"], context="Generation 15 mins")
     validate_columns(cons_df, ["Date", "Time", "Consumption", "Unit"], context="Consumption 15_mins")
     validate_no_nans(gen_df, ["Date", "Time", "Day Gen (KWh)"], context="Generation 15 mins")
     validate_no_nans(cons_df, ["Date", "Time", "Consumption", "Unit"], context="Consumption 15_mins")
-    gen_df["Date"] = pd.to_datetime(gen_df["Date"]).dt.date
-    gen_df["Time"] = pd.to_datetime(gen_df["Time"]).dt.time
-    cons_df["Date"] = pd.to_datetime(cons_df["Date"]).dt.date
-    cons_df["Time"] = pd.to_datetime(cons_df["Time"]).dt.time
-    result_rows = []
-    for (date, time), gen_row in gen_df.groupby(["Date", "Time"]):
-        generation_available = gen_row["Day Gen (KWh)"].values[0]
-        slot_df = cons_df[(cons_df["Date"] == date) & (cons_df["Time"] == time)].copy()
-        slot_df["Generation_value"] = 0.0
-        slot_df["Surplus_Generation"] = 0.0
-        slot_df["Surplus_Demand"] = 0.0
-        for unit in priority_units:
-            if generation_available <= 0:
-                break
-            mask = slot_df["Unit"].str.upper() == unit.upper()
-            if mask.any():
-                cons_val = slot_df.loc[mask, "Consumption"].values[0]
-                assigned = min(cons_val, generation_available)
-                slot_df.loc[mask, "Generation_value"] = assigned
-                if assigned < cons_val:
-                    slot_df.loc[mask, "Surplus_Demand"] = cons_val - assigned
-                generation_available -= assigned
-        remaining = slot_df[~slot_df["Unit"].str.upper().isin([u.upper() for u in priority_units])]
-        remaining = remaining.sort_values(by="Consumption", ascending=False)
-        for idx, row in remaining.iterrows():
-            if generation_available <= 0:
-                slot_df.loc[idx, "Surplus_Demand"] = row["Consumption"]
-                continue
-            cons_val = row["Consumption"]
-            assigned = min(cons_val, generation_available)
-            slot_df.loc[idx, "Generation_value"] = assigned
-            if assigned < cons_val:
-                slot_df.loc[idx, "Surplus_Demand"] = cons_val - assigned
-            generation_available -= assigned
-        if generation_available > 0 and not slot_df.empty:
-            last_idx = slot_df.index[-1]
-            slot_df.loc[last_idx, "Surplus_Generation"] = generation_available
-            generation_available = 0
-        result_rows.append(slot_df)
-    final_df = pd.concat(result_rows, ignore_index=True)
+    # Slots are matched on one datetime64 key rather than on date and time objects
+    gen_df["Slot"] = _slot_start(gen_df)
+    cons_df["Slot"] = _slot_start(cons_df)
+    # One row per consumption record that has a generation slot (the first generation row of a
+    # slot, as groupby's values[0] took), in slot order and the consumption file's order within a slot
+    slot_gen = gen_df.drop_duplicates("Slot")[["Slot", "Day Gen (KWh)"]]
+    final_df = (
+        cons_df.drop(columns=["Date", "Time"])
+               .assign(_row=np.arange(len(cons_df)))
+               .merge(slot_gen, on="Slot")
+               .sort_values(["Slot", "_row"], kind="stable")
+               .drop(columns="_row")
+               .reset_index(drop=True)
+    )
+    slots = final_df["Slot"].to_numpy()
+    slot_starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])[:len(final_df)]
+    slot_ids = np.repeat(np.arange(len(slot_starts)), np.diff(np.r_[slot_starts, len(final_df)]))
+    # Allocation order within a slot: priority units in priority order, then the other units by
+    # descending consumption (lexsort is stable, so ties keep the file's order)
+    cons = final_df["Consumption"].to_numpy(dtype=np.float64)
+    # Units are upper-cased and ranked once per distinct unit, then spread to rows by their codes
+    unit_codes, unit_names = pd.factorize(final_df["Unit"])
+    unit_rank = pd.Index(unit_names).str.upper().map({unit: i for i, unit in enumerate(priority_units)})
+    rank = np.asarray(unit_rank, dtype=np.float64)[unit_codes]
+    is_priority = ~np.isnan(rank)
+    order = np.lexsort((-cons, np.nan_to_num(rank, nan=len(priority_units)), slot_ids))
+    assigned, demand, leftover = _allocate_generation(
+        np.r_[slot_starts, len(final_df)],
+        final_df["Day Gen (KWh)"].to_numpy(dtype=np.float64)[slot_starts],
+        cons[order],
+        is_priority[order],
+    )
+    generation_value = np.zeros(len(final_df))
+    generation_value[order] = assigned
+    surplus_demand = np.zeros(len(final_df))
+    surplus_demand[order] = demand
+    # Generation left over in a slot goes on the slot's last row
+    surplus_generation = np.zeros(len(final_df))
+    if len(final_df):
+        surplus_generation[np.r_[slot_starts[1:], len(final_df)] - 1] = leftover
+    final_df["Date"] = final_df["Slot"].dt.date
+    final_df["Time"] = final_df["Slot"].dt.time
+    final_df = final_df.drop(columns=["Slot", "Day Gen (KWh)"])
+    final_df["Generation_value"] = generation_value
+    final_df["Surplus_Generation"] = surplus_generation
+    final_df["Surplus_Demand"] = surplus_demand
     final_df = final_df.rename(columns={
         "Consumption": "Consumption_value",
         "Location": "Unit",
     })
     final_df = final_df.fillna(0)
-    final_df[[
+    write_sheet(final_df[[
         "Date", "Time", "Unit", "ToD_Slot",
         "Consumption_value", "Generation_value",
         "Surplus_Generation", "Surplus_Demand"
-    ]].to_excel(output_file, index=False, sheet_name="15 mins")
+    ]], output_file, "15 mins", mode="w")
     print(f"✅ File created: {output_file}")
 
 def aggregate_hourly(input_file, output_file):
     validate_file_exists(input_file)
-    df = pd.read_excel(input_file)
+    df = read_sheet(input_file, "15 mins")
     validate_columns(df, ["Date", "Time", "Unit", "ToD_Slot", "Consumption_value", "Generation_value", "Surplus_Generation", "Surplus_Demand"], context="15 mins merged")
     validate_no_nans(df, ["Date", "Time", "Unit", "ToD_Slot", "Consumption_value", "Generation_value"], context="15 mins merged")
-    df["DateTime"] = pd.to_datetime(df["Date"].astype(str) + " " + df["Time"].astype(str))
+    df["DateTime"] = _slot_start(df)
     df["Date"] = df["DateTime"].dt.date
     df["Time"] = df["DateTime"].dt.floor("H").dt.time
+    # Group on the category codes of the repeated string keys rather than hashing each row's strings
+    df["Unit"] = df["Unit"].astype("category")
+    df["ToD_Slot"] = df["ToD_Slot"].astype("category")
     hourly_df = df.groupby(
-        ["Date", "Time", "Unit", "ToD_Slot"], as_index=False
+        ["Date", "Time", "Unit", "ToD_Slot"], as_index=False, observed=True
     ).agg({
         "Consumption_value": "sum",
         "Generation_value": "sum",
@@ -197,11 +275,10 @@ def aggregate_hourly(input_file, output_file):
     )
     hourly_df = hourly_df.drop(columns=["Surplus_Generation", "Surplus_Demand"])
     validate_nonempty(hourly_df, context="Hourly aggregated data")
-    hourly_df.to_excel(output_file, index=False)
+    hourly_df.to_excel(output_file, index=False, engine=EXCEL_WRITE_ENGINE)
     print(f"✅ Hourly aggregated file created: {output_file}")
 
 def format_date_in_csv(input_csv, output_csv):
-    import os
     if not os.path.exists(input_csv):
         raise FileNotFoundError(f"File not found: {input_csv}")
     df = pd.read_csv(input_csv)
@@ -211,27 +288,29 @@ def format_date_in_csv(input_csv, output_csv):
     print(f"✅ Date formatted and saved to {output_csv}")
 
 if __name__ == "__main__":
-    # Step 1: Merge inverter data
     base_folder = "Inverter Dump Aug 2025"
     merged_file = "Generation_Data_Aug_Merged.xlsx"
-    merge_inverter_data(base_folder, merged_file)
-    # Generation data will also be saved to Generation_Data_Aug.xlsx after merging
-
+    consumption_file = "consumption_consolidated_aug.xlsx"
+    output_file = "Consumption_Generation_Aug25.xlsx"
+    hourly_output_file = "Consumption_Generation_Aug25_hourly.xlsx"
+    # Stages hand their sheets over in memory; the merged workbook is created with all of its
+    # sheets in one pass when the block exits instead of being reloaded to append each sheet
+    with sheet_cache():
+        # Step 1: Merge inverter data
+        merge_inverter_data(base_folder, merged_file)
+        # Generation data will also be saved to Generation_Data_Aug.xlsx after merging
 
-    # Step 2: Aggregate to 15-minute intervals
-    aggregate_15min(merged_file)
+        # Step 2: Aggregate to 15-minute intervals
+        aggregate_15min(merged_file)
 
-    # Step 3: Split Date and Time
-    split_date_time(merged_file)
+        # Step 3: Split Date and Time
+        split_date_time(merged_file)
 
-    # Step 4: Merge Generation and Consumption
-    consumption_file = "consumption_consolidated_aug.xlsx"
-    output_file = "Consumption_Generation_Aug25.xlsx"
-    merge_generation_consumption(merged_file, consumption_file, output_file)
+        # Step 4: Merge Generation and Consumption
+        merge_generation_consumption(merged_file, consumption_file, output_file)
 
-    # Step 5: Aggregate to hourly
-    hourly_output_file = "Consumption_Generation_Aug25_hourly.xlsx"
-    aggregate_hourly(output_file, hourly_output_file)
+        # Step 5: Aggregate to hourly
+        aggregate_hourly(output_file, hourly_output_file)
 
     # # Step 6: Format date in CSV
     # input_csv = r"CSV/CSV_AUG/Gen_Con_hourly_Aug25_hourly.csv"
@@ -1,18 +1,22 @@
+from typing import Optional
+
+import numpy as np
 import pandas as pd
+from excel_utils import EXCEL_WRITE_ENGINE, read_sheet, sheet_cache, write_sheet
+from numba_utils import njit
+
+# Units settled first, in this order, against banked generation
+PRIORITY_UNITS = ["MALLESWARAM", "SAHAKAR NAGAR", "HRBR UNIT", "OLD AIRPORT ROAD"]
 
 def calculate_matched_settlement(input_file: str, input_sheet: str, output_sheet: str) -> None:
-    df = pd.read_excel(input_file, sheet_name=input_sheet)
+    df = read_sheet(input_file, input_sheet)
     # Calculate matched settlement
     df['Matched_Settlement'] = df[['Generation_value', 'Consumption_value']].min(axis=1)
     # Keep only date (no time)
     df['Date'] = pd.to_datetime(df['Date']).dt.date
     # Write back to Excel
-    with pd.ExcelWriter(input_file, mode="a", engine="openpyxl", if_sheet_exists="replace") as writer:
-        df.to_excel(writer, sheet_name=output_sheet, index=False)
+    write_sheet(df, input_file, output_sheet)
     print(f"✅ Matched settlement column added and saved to sheet '{output_sheet}'.")
-    import gc, time
-    gc.collect()
-    time.sleep(0.1)
 
 def add_unit_id(input_file: str, input_sheet: str, output_sheet: str) -> None:
     # Create mapping dict
@@ -29,109 +33,117 @@ def add_unit_id(input_file: str, input_sheet: str, output_sheet: str) -> None:
         "THANISANDRA": "C8HT-135",
         "OLD AIRPORT ROAD": "E6HT209"
     }
-    df = pd.read_excel(input_file, sheet_name=input_sheet)
+    df = read_sheet(input_file, input_sheet)
     print("DEBUG: Columns in DataFrame before mapping:", df.columns.tolist())
     # Prefer "Location" if present, else use "Unit"
     if "Location" in df.columns:
-        df["Unit"] = df["Location"].str.upper().map(lambda u: f"{u} ({unit_map.get(u, '')})")
+        names = df["Location"].str.upper()
+        df["Unit"] = names + " (" + names.map(unit_map).fillna("") + ")"
     elif "Unit" in df.columns:
         # Only update if not already mapped (i.e., if not already in the format "NAME (ID)")
-        def map_unit(u):
-            u_upper = str(u).upper()
-            if "(" in u_upper and ")" in u_upper:
-                return u  # Already mapped
-            return f"{u_upper} ({unit_map.get(u_upper, '')})"
-        df["Unit"] = df["Unit"].map(map_unit)
+        names = df["Unit"].astype(str).str.upper()
+        mapped = names.str.contains("(", regex=False) & names.str.contains(")", regex=False)
+        df["Unit"] = df["Unit"].where(mapped, names + " (" + names.map(unit_map).fillna("") + ")")
     else:
         raise KeyError("Neither 'Location' nor 'Unit' column found in input sheet for unit ID mapping.")
-    with pd.ExcelWriter(input_file, mode="a", engine="openpyxl", if_sheet_exists="replace") as writer:
-        df.to_excel(writer, sheet_name=output_sheet, index=False)
+    write_sheet(df, input_file, output_sheet)
     print(f"✅ Unit IDs added and saved to sheet '{output_sheet}'")
-    import gc, time
-    gc.collect()
-    time.sleep(0.1)
 
 def monthly_aggregation(input_file: str, input_sheet: str, output_sheet: str) -> None:
-    df = pd.read_excel(input_file, sheet_name=input_sheet)
+    df = read_sheet(input_file, input_sheet)
     df["Date"] = pd.to_datetime(df["Date"])
     df["Month"] = df["Date"].dt.to_period("M").astype(str)
-    monthly_df = df.groupby(
-        ["Month", "Unit"], as_index=False
-    ).agg({
-        "Consumption_value": "sum",
-        "Generation_value": "sum",
-        "Surplus_Generation": "sum",
-        "Surplus_Demand": "sum",
-        "Matched_Settlement": "sum"
-    })
-    with pd.ExcelWriter(input_file, mode="a", engine="openpyxl", if_sheet_exists="replace") as writer:
-        monthly_df.to_excel(writer, sheet_name=output_sheet, index=False)
+    value_columns = ["Consumption_value", "Generation_value", "Surplus_Generation", "Surplus_Demand", "Matched_Settlement"]
+    # Sort once and sum each contiguous (Month, Unit) run with np.add.reduceat instead of a hash
+    # groupby; NaN keys are dropped and NaN values count as 0, as groupby().sum() does
+    df = df.dropna(subset=["Month", "Unit"]).sort_values(["Month", "Unit"], kind="stable")
+    months = df["Month"].to_numpy()
+    units = df["Unit"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, (months[1:] != months[:-1]) | (units[1:] != units[:-1])])[:len(df)]
+    values = np.nan_to_num(df[value_columns].to_numpy(dtype=np.float64))
+    totals = np.add.reduceat(values, starts, axis=0) if len(df) else values
+    monthly_df = pd.DataFrame(totals, columns=value_columns)
+    monthly_df.insert(0, "Month", months[starts])
+    monthly_df.insert(1, "Unit", units[starts])
+    write_sheet(monthly_df, input_file, output_sheet)
     print(f"✅ Monthly aggregated data saved to sheet '{output_sheet}'")
-    import gc, time
-    gc.collect()
-    time.sleep(0.1)
+
+@njit(cache=True)
+def _bank_surplus(demand, total_gen):
+    """
+    Settles each unit's surplus demand, in order, against the month's banked surplus generation
+    (8% banking loss in each direction). Sequential by nature: every unit draws on what the
+    previous ones left. Returns (settlement, generation left after, demand left after) arrays.
+    """
+    n = demand.shape[0]
+    settlement = np.zeros(n)
+    gen_after = np.zeros(n)
+    demand_after = np.zeros(n)
+    for i in range(n):
+        d = demand[i]
+        if total_gen >= d * 1.08:
+            s = d
+            total_gen -= d * 1.08
+        elif total_gen > 0:
+            s = total_gen * 0.92
+            total_gen = 0.0
+        else:
+            s = 0.0
+        settlement[i] = s
+        gen_after[i] = max(total_gen, 0.0)
+        demand_after[i] = max(d - s, 0.0)
+    return settlement, gen_after, demand_after
 
 def apply_monthly_banking_settlement(input_file: str, input_sheet: str = "monthly", output_sheet: str = "banking_settlement") -> None:
-    df = pd.read_excel(input_file, sheet_name=input_sheet)
+    df = read_sheet(input_file, input_sheet)
     df["Month"] = df["Month"]
-    priority_units = ["MALLESWARAM", "SAHAKAR NAGAR", "HRBR UNIT", "OLD AIRPORT ROAD"]
+    # Priority rank of each distinct unit (after the priority units for the others): the first
+    # priority name contained in the unit name, so "HRBR UNIT (123)" or "Malleswaram-2" match too.
+    # Looked up once per unit instead of per row of every month
+    unit_rank = {
+        unit: next((i for i, p in enumerate(PRIORITY_UNITS) if p in str(unit).upper()), len(PRIORITY_UNITS))
+        for unit in df["Unit"].unique()
+    }
     results = []
     for month, month_df in df.groupby("Month"):
         total_gen = month_df["Surplus_Generation"].sum()
         month_df = month_df.copy()
-        month_df["Settlement_with_Banking"] = 0.0
-        month_df["Surplus_Generation_After_Banking"] = 0.0
-        month_df["Surplus_Demand_After_Banking"] = 0.0
-        pr_df = month_df[month_df["Unit"].str.contains("|".join(priority_units), case=False, regex=True)]
-        other_df = month_df.drop(pr_df.index)
-        if not pr_df.empty:
-            pr_df["PriorityOrder"] = pr_df["Unit"].apply(
-                lambda u: priority_units.index(next(p for p in priority_units if p.lower() in u.lower()))
-            )
-            pr_df = pr_df.sort_values("PriorityOrder")
-        other_df = other_df.sort_values("Surplus_Demand", ascending=False)
-        ordered_units = pd.concat([pr_df, other_df])
-        for idx, row in ordered_units.iterrows():
-            demand = row["Surplus_Demand"]
-            if total_gen >= demand * 1.08:
-                settlement = demand
-                total_gen -= demand * 1.08
-            elif total_gen > 0:
-                settlement = total_gen * 0.92
-                total_gen = 0
-            else:
-                settlement = 0
-            month_df.at[idx, "Settlement_with_Banking"] = settlement
-            month_df.at[idx, "Surplus_Generation_After_Banking"] = max(total_gen, 0)
-            month_df.at[idx, "Surplus_Demand_After_Banking"] = max(demand - settlement, 0)
+        demand = month_df["Surplus_Demand"].to_numpy(dtype=np.float64)
+        # Priority units in priority order, then the others by descending surplus demand
+        order = np.lexsort((-demand, month_df["Unit"].map(unit_rank).to_numpy()))
+        settlement, gen_after, demand_after = _bank_surplus(demand[order], float(total_gen))
+        for col, values in (
+            ("Settlement_with_Banking", settlement),
+            ("Surplus_Generation_After_Banking", gen_after),
+            ("Surplus_Demand_After_Banking", demand_after),
+        ):
+            month_values = np.empty(len(month_df))
+            month_values[order] = values
+            month_df[col] = month_values
         results.append(month_df)
     final_df = pd.concat(results)
-    with pd.ExcelWriter(input_file, mode="a", engine="openpyxl", if_sheet_exists="replace") as writer:
-        final_df.to_excel(writer, sheet_name=output_sheet, index=False)
+    write_sheet(final_df, input_file, output_sheet)
     print(f"✅ Banking settlement applied and saved to sheet '{output_sheet}'.")
-    import gc, time
-    gc.collect()
-    time.sleep(0.1)
 
-def calculate_savings_comparison(input_file: str, sheet_name: str, high_grid_rate_per_kwh: float, low_grid_rate_per_kwh: float, renewable_rate_per_kwh: float, output_sheet: str = "monthly_saving") -> None:
-    df = pd.read_excel(input_file, sheet_name=sheet_name).copy()
+def calculate_savings_comparison(input_file: str, sheet_name: str, high_grid_rate_per_kwh: float, low_grid_rate_per_kwh: float, renewable_rate_per_kwh: float, output_sheet: str = "monthly_saving", output_file: Optional[str] = None) -> None:
+    # output_file: optionally also write the result as its own workbook (e.g. for a separate download)
+    df = read_sheet(input_file, sheet_name).copy()
     high_rate_units = [
         "MALLESWARAM (C2HT-136)",
         "HRBR UNIT (E8HT-203)",
         "OLD AIRPORT ROAD (E6HT209)",
         "SAHAKAR NAGAR (C8HT-111)"
     ]
-    df["grid_rate"] = df["Unit"].apply(
-        lambda u: high_grid_rate_per_kwh if u in high_rate_units else low_grid_rate_per_kwh
-    )
+    df["grid_rate"] = np.where(df["Unit"].isin(high_rate_units), high_grid_rate_per_kwh, low_grid_rate_per_kwh)
     df["grid_cost"] = df["Consumption_value"] * df["grid_rate"]
     # With Banking
+    settled_with_banking = df["Settlement_with_Banking"] + df["Matched_Settlement"]
     df["grid_consumption_with_banking"] = (
-        df["Consumption_value"] - (df["Settlement_with_Banking"] + df["Matched_Settlement"])
+        df["Consumption_value"] - settled_with_banking
     ).clip(lower=0)
     df["actual_cost_with_banking"] = (
         df["grid_consumption_with_banking"] * df["grid_rate"] +
-        (df["Settlement_with_Banking"] + df["Matched_Settlement"]) * renewable_rate_per_kwh
+        settled_with_banking * renewable_rate_per_kwh
     )
     df["savings_with_banking"] = df["grid_cost"] - df["actual_cost_with_banking"]
     df["savings_pct_with_banking"] = (
@@ -156,32 +168,31 @@ def calculate_savings_comparison(input_file: str, sheet_name: str, high_grid_rat
         "actual_cost_without_banking", "savings_without_banking", "savings_pct_without_banking"
     ]
     df = df[output_cols]
-    with pd.ExcelWriter(input_file, mode="a", engine="openpyxl", if_sheet_exists="replace") as writer:
-        df.to_excel(writer, sheet_name=output_sheet, index=False)
-        print("Monthly saving data saved")
-    import gc, time
-    gc.collect()
-    time.sleep(0.1)
+    write_sheet(df, input_file, output_sheet)
+    if output_file is not None:
+        df.to_excel(output_file, index=False, engine=EXCEL_WRITE_ENGINE)
+    print("Monthly saving data saved")
 
 def main():
     input_file = "Consumption_Generation_Aug25.xlsx"
-    # Step 1: Matched Settlement
-    calculate_matched_settlement(input_file, "15 mins", "matched_settlement")
-    # Step 2: Add Unit ID
-    add_unit_id(input_file, "matched_settlement", "matched_settlement_with_id")
-    # Step 3: Monthly Aggregation
-    monthly_aggregation(input_file, "matched_settlement_with_id", "monthly")
-    # Step 4: Banking Settlement
-    apply_monthly_banking_settlement(input_file, "monthly", "banking_settlement")
-    # Step 5: Savings Calculation
-    calculate_savings_comparison(
-        input_file=input_file,
-        sheet_name="banking_settlement",
-        high_grid_rate_per_kwh=7.20,
-        low_grid_rate_per_kwh=5.95,
-        renewable_rate_per_kwh=1.0,
-        output_sheet="monthly_saving"
-    )
+    with sheet_cache():
+        # Step 1: Matched Settlement
+        calculate_matched_settlement(input_file, "15 mins", "matched_settlement")
+        # Step 2: Add Unit ID
+        add_unit_id(input_file, "matched_settlement", "matched_settlement_with_id")
+        # Step 3: Monthly Aggregation
+        monthly_aggregation(input_file, "matched_settlement_with_id", "monthly")
+        # Step 4: Banking Settlement
+        apply_monthly_banking_settlement(input_file, "monthly", "banking_settlement")
+        # Step 5: Savings Calculation
+        calculate_savings_comparison(
+            input_file=input_file,
+            sheet_name="banking_settlement",
+            high_grid_rate_per_kwh=7.20,
+            low_grid_rate_per_kwh=5.95,
+            renewable_rate_per_kwh=1.0,
+            output_sheet="monthly_saving"
+        )
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,296 @@
+import contextlib
+import contextvars
+import datetime
+import glob
+import hashlib
+import importlib.util
+import os
+import threading
+import urllib.parse
+import zipfile
+from xml.etree import ElementTree
+
+import pandas as pd
+
+# Rust-backed python-calamine parses xlsx much faster than openpyxl; fall back to the
+# pandas default engine when it is not installed.
+EXCEL_READ_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") else None
+# New workbooks are written with xlsxwriter when installed, which is much faster than openpyxl
+# (appending a sheet to an existing workbook still needs openpyxl). Its constant_memory option
+# is not used: pandas emits cells column by column, and constant_memory keeps only the current
+# row, so every column but the last would be written empty.
+EXCEL_WRITE_ENGINE = "xlsxwriter" if importlib.util.find_spec("xlsxwriter") else "openpyxl"
+
+def read_excel(path, sheet_name=0, usecols=None, **kwargs):
+    """
+    pd.read_excel using the fastest available engine.
+    - path: file path or file-like object
+    - sheet_name, usecols, **kwargs: passed through to pd.read_excel
+    """
+    return pd.read_excel(path, sheet_name=sheet_name, usecols=usecols, engine=EXCEL_READ_ENGINE, **kwargs)
+
+# Where cached_read_excel keeps its Parquet copies, away from the workbooks (and the
+# deliverable folders) they were parsed from
+EXCEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".excel_cache")
+
+def cached_read_excel(path, sheet_name=0, usecols=None):
+    """
+    Like read_excel, but keeps a Parquet copy of the parsed sheet in EXCEL_CACHE_DIR,
+    keyed on the workbook's path and mtime, and reads that on later calls. Re-running a
+    loader on an unchanged file then skips the xlsx parse entirely. Copies made for older
+    versions of the workbook are deleted when a new one is written.
+    - path: path to an .xlsx file
+    - sheet_name: a single sheet name or index
+    - usecols: list of column names (part of the cache key)
+    Falls back to a plain read when no Parquet engine is installed or the sheet cannot
+    be stored as Parquet.
+    """
+    key = hashlib.md5(repr((os.path.abspath(path), sheet_name, usecols)).encode("utf-8")).hexdigest()[:12]
+    cache_path = os.path.join(EXCEL_CACHE_DIR, f"{key}.{os.stat(path).st_mtime_ns}.parquet")
+    if os.path.exists(cache_path):
+        try:
+            return pd.read_parquet(cache_path)
+        except Exception:
+            pass
+    df = read_excel(path, sheet_name=sheet_name, usecols=usecols)
+    for stale in glob.glob(os.path.join(glob.escape(EXCEL_CACHE_DIR), f"{key}.*.parquet")):
+        try:
+            os.remove(stale)
+        except OSError:
+            # already removed by a concurrent call, or locked; the cache is optional
+            pass
+    try:
+        os.makedirs(EXCEL_CACHE_DIR, exist_ok=True)
+        df.to_parquet(cache_path, index=False)
+    except Exception:
+        # no pyarrow/fastparquet, or mixed-type object columns; the cache is optional
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+    return df
+
+def workbook_sheet_names(path):
+    """
+    Sheet names of an xlsx workbook, in order, read from its xl/workbook.xml part alone
+    instead of loading the workbook.
+    """
+    with zipfile.ZipFile(path) as archive, archive.open("xl/workbook.xml") as part:
+        root = ElementTree.parse(part).getroot()
+    # match on the local name: transitional and strict OOXML use different namespaces
+    return [el.get("name") for el in root.iter() if el.tag.rsplit("}", 1)[-1] == "sheet"]
+
+def sheet_parquet_path(path, sheet_name):
+    """
+    Path of the Parquet copy write_sheet keeps for one sheet of a workbook. The sheet name is
+    percent-encoded, so names like "15 mins" and "15_mins" get different files.
+    """
+    return f"{path}.{urllib.parse.quote(sheet_name, safe='')}.parquet"
+
+def _as_read_back(df):
+    """
+    Returns df with the object columns converted the way an xlsx round trip converts them
+    (date cells come back as datetime64; pandas writes time values as "HH:MM:SS" text cells, so
+    they come back as strings), so a sheet read from its in-memory or Parquet copy behaves like
+    one read from the workbook.
+    """
+    converted = {}
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        values = df[col].dropna()
+        if values.empty:
+            continue
+        first = values.iloc[0]
+        if isinstance(first, datetime.time):
+            converted[col] = df[col].map(lambda v: v.isoformat() if isinstance(v, datetime.time) else v)
+        elif isinstance(first, datetime.date) and not isinstance(first, datetime.datetime):
+            converted[col] = pd.to_datetime(df[col])
+    return df.assign(**converted) if converted else df
+
+class _SheetBlock:
+    """State of one sheet_cache() block."""
+    def __init__(self):
+        # (absolute path, sheet name) -> DataFrame as read_sheet should return it
+        self.frames = {}
+        # absolute path -> {sheet name: DataFrame} written inside the block, not saved yet
+        self.pending = {}
+        # absolute paths of the pending workbooks that are (re)created rather than appended to
+        self.created = set()
+        # worker threads that joined the block share this object, so its dicts change under a lock
+        self.lock = threading.Lock()
+
+# The innermost sheet_cache() block of the current context. A context variable rather than a
+# global: Streamlit runs sessions in threads, and each run must only see its own block.
+_active_block = contextvars.ContextVar("sheet_cache_block", default=None)
+
+@contextlib.contextmanager
+def sheet_cache():
+    """
+    Within this block, sheets written with write_sheet are kept in memory and read_sheet hands
+    back a copy of them, so consecutive pipeline stages pass their DataFrames over in memory
+    instead of through Parquet or xlsx. Workbooks are saved when the block exits, with all of
+    their sheets in one writer: a workbook created in the block is written in a single pass
+    without ever being loaded, and one appended to gets one openpyxl load/save instead of one
+    per sheet. Worker threads join the block when run via contextvars.copy_context().run.
+    Usage:
+        with sheet_cache():
+            add_tod_slot(consolidated_file)
+            split_hourly_to_15min(consolidated_file)
+    """
+    block = _SheetBlock()
+    token = _active_block.set(block)
+    try:
+        yield
+    finally:
+        _active_block.reset(token)
+        for path, sheets in block.pending.items():
+            _save_sheets(path, sheets, create=path in block.created)
+
+def _save_sheets(path, sheets, create=False):
+    """
+    Writes the given {sheet name: DataFrame} sheets to the workbook at path, in one writer.
+    - create: replace the workbook with just these sheets instead of adding them to it
+    Drops the Parquet copies of these sheets, which would be stale from now on; write_sheet
+    writes a fresh one after a save outside a sheet_cache() block.
+    """
+    for sheet_name in sheets:
+        cache_path = sheet_parquet_path(path, sheet_name)
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+    if create:
+        writer = pd.ExcelWriter(path, engine=EXCEL_WRITE_ENGINE)
+    else:
+        writer = pd.ExcelWriter(path, engine="openpyxl", mode="a", if_sheet_exists="replace")
+    with writer:
+        for sheet_name, df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+def pending_sheet_names(path):
+    """Sheets written to path inside the current sheet_cache() block that are not saved yet."""
+    block = _active_block.get()
+    if block is None:
+        return []
+    with block.lock:
+        return list(block.pending.get(os.path.abspath(path), ()))
+
+def workbook_is_pending(path):
+    """True if the workbook at path is created inside the current sheet_cache() block and not saved yet."""
+    block = _active_block.get()
+    if block is None:
+        return False
+    with block.lock:
+        return os.path.abspath(path) in block.created
+
+def write_sheet(df, path, sheet_name, mode="a"):
+    """
+    Writes df to sheet_name of the workbook at path and keeps a copy of that sheet for
+    read_sheet: in memory inside a sheet_cache() block, otherwise as a Snappy-compressed Parquet
+    file next to the workbook. The xlsx stays the deliverable (downloads, DB loaders); the copy
+    only spares the next pipeline stage an xlsx parse.
+    - mode: "a" adds or replaces the sheet in an existing workbook, "w" replaces the workbook
+      with just this sheet (and drops the copies of its previous sheets); inside a
+      sheet_cache() block either is saved when the block exits
+    """
+    block = _active_block.get()
+    workbook = os.path.abspath(path)
+    read_back = _as_read_back(df)
+    if mode == "w":
+        for stale in glob.glob(f"{glob.escape(str(path))}.*.parquet"):
+            os.remove(stale)
+    if block is not None:
+        frame = read_back.copy() if read_back is df else read_back
+        with block.lock:
+            if mode == "w":
+                for key in [key for key in block.frames if key[0] == workbook]:
+                    del block.frames[key]
+                block.pending[workbook] = {sheet_name: df}
+                block.created.add(workbook)
+            else:
+                block.pending.setdefault(workbook, {})[sheet_name] = df
+            block.frames[(workbook, sheet_name)] = frame
+        return
+    _save_sheets(path, {sheet_name: df}, create=mode == "w")
+    _write_sheet_copy(path, sheet_name, read_back)
+
+def write_sheets(frames, path):
+    """
+    Replaces the workbook at path with the given {sheet name: DataFrame} sheets, saved in one
+    writer instead of one load and save per sheet, and keeps a copy of each sheet for read_sheet
+    like write_sheet does. Inside a sheet_cache() block the workbook is saved when the block exits.
+    """
+    block = _active_block.get()
+    workbook = os.path.abspath(path)
+    read_backs = {sheet_name: _as_read_back(df) for sheet_name, df in frames.items()}
+    for stale in glob.glob(f"{glob.escape(str(path))}.*.parquet"):
+        os.remove(stale)
+    if block is not None:
+        with block.lock:
+            for key in [key for key in block.frames if key[0] == workbook]:
+                del block.frames[key]
+            block.pending[workbook] = dict(frames)
+            block.created.add(workbook)
+            for sheet_name, df in frames.items():
+                read_back = read_backs[sheet_name]
+                block.frames[(workbook, sheet_name)] = read_back.copy() if read_back is df else read_back
+        return
+    _save_sheets(path, frames, create=True)
+    for sheet_name, read_back in read_backs.items():
+        _write_sheet_copy(path, sheet_name, read_back)
+
+def _write_sheet_copy(path, sheet_name, read_back):
+    """Saves the Parquet copy of a sheet that was just written to the workbook at path."""
+    cache_path = sheet_parquet_path(path, sheet_name)
+    try:
+        read_back.to_parquet(cache_path, index=False, compression="snappy")
+    except Exception:
+        # no pyarrow/fastparquet, or mixed-type object columns; read_sheet falls back to the xlsx
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+def read_sheet(path, sheet_name, usecols=None, excel_sheet=None):
+    """
+    Reads a sheet written by write_sheet, from its in-memory or Parquet copy when there is one
+    and from the workbook otherwise. Only use it for workbooks the pipeline writes through
+    write_sheet; an xlsx edited by hand would not refresh the copy.
+    - usecols: list of column names to read (all columns if None); names the sheet does not
+      have are left out, so the caller's validate_columns can report them
+    - excel_sheet: sheet name or index to read from the workbook when there is no copy
+      (sheet_name if None), e.g. 0 for a workbook that may also come from outside the pipeline
+    """
+    if excel_sheet is None:
+        excel_sheet = sheet_name
+    block = _active_block.get()
+    if block is not None:
+        with block.lock:
+            cached = block.frames.get((os.path.abspath(path), sheet_name))
+        if cached is not None:
+            # stages add columns to what they read, so each gets its own copy
+            if usecols is None:
+                return cached.copy()
+            return cached[[col for col in usecols if col in cached.columns]].copy()
+    cache_path = sheet_parquet_path(path, sheet_name)
+    if os.path.exists(cache_path):
+        try:
+            return pd.read_parquet(cache_path, columns=usecols)
+        except Exception:
+            pass
+    if usecols is None:
+        return read_excel(path, sheet_name=excel_sheet)
+    df = read_excel(path, sheet_name=excel_sheet, usecols=lambda col: col in usecols)
+    return df[[col for col in usecols if col in df.columns]]
+
+def read_workbook(path):
+    """
+    Reads every sheet of a workbook as {sheet name: DataFrame}, like read_excel(sheet_name=None).
+    A workbook created inside the current sheet_cache() block comes from memory, in sheet order.
+    """
+    block = _active_block.get()
+    workbook = os.path.abspath(path)
+    if block is not None:
+        with block.lock:
+            if workbook in block.created:
+                frames = [(name, block.frames[(workbook, name)]) for name in block.pending[workbook]]
+            else:
+                frames = None
+        if frames is not None:
+            return {name: frame.copy() for name, frame in frames}
+    return read_excel(path, sheet_name=None)
@@ -0,0 +1,13 @@
+import importlib.util
+
+# numba is optional: without it, functions decorated with njit simply run as plain Python
+NUMBA_AVAILABLE = importlib.util.find_spec("numba") is not None
+
+if NUMBA_AVAILABLE:
+    from numba import njit
+else:
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit, usable bare (@njit) or with options (@njit(cache=True))."""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda fn: fn
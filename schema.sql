@@ -76,3 +76,18 @@ CREATE TABLE IF NOT EXISTS public.monthly_savings_v2 (
     savings_without_banking     NUMERIC(15,4),
     savings_pct_without_banking NUMERIC(6,2)
 );
+
+-- ============================================================
+-- Unique keys used by the loaders' ON CONFLICT DO NOTHING
+-- ============================================================
+CREATE UNIQUE INDEX IF NOT EXISTS gen_cons_15min_data_v2_key
+    ON public.gen_cons_15min_data_v2 (reading_date, reading_time, unit);
+
+CREATE UNIQUE INDEX IF NOT EXISTS hourly_gen_con2_v2_key
+    ON public.hourly_gen_con2_v2 (date, time, unit);
+
+CREATE UNIQUE INDEX IF NOT EXISTS monthly_banking_settlement_data_v2_key
+    ON public.monthly_banking_settlement_data_v2 (month, unit);
+
+CREATE UNIQUE INDEX IF NOT EXISTS monthly_savings_v2_key
+    ON public.monthly_savings_v2 (month, unit);
@@ -1,8 +1,13 @@
+import os
+
 import pandas as pd
 import numpy as np
+from excel_utils import pending_sheet_names, workbook_is_pending, workbook_sheet_names
+from numba_utils import NUMBA_AVAILABLE, njit
 
 def validate_columns(df, required_columns, context=""):
-    missing = [col for col in required_columns if col not in df.columns]
+    present = set(df.columns)
+    missing = [col for col in required_columns if col not in present]
     if missing:
         raise ValueError(
             f"Missing required columns {missing} in {context}. "
@@ -10,41 +15,82 @@ def validate_columns(df, required_columns, context=""):
         )
 
 def validate_no_nans(df, columns, context=""):
-    for col in columns:
-        nan_mask = df[col].isnull()
-        if nan_mask.any():
-            nan_indices = df.index[nan_mask].tolist()
-            nan_preview = df.loc[nan_mask, col].head(5).tolist()
-            details = [
-                f"Row {idx}, Column '{col}', Value: {repr(val)}"
-                for idx, val in zip(nan_indices[:5], nan_preview)
-            ]
-            raise ValueError(
-                f"NaN (missing) values found in column '{col}' in {context}.\n"
-                f"First 5 occurrences:\n" +
-                "\n".join(details) +
-                "\nPlease check your file for empty or invalid cells in these locations."
-            )
+    values = df[list(columns)]
+    # Plain NumPy numeric columns: integer columns cannot hold NaN and float columns get one
+    # np.isnan over their raw values, without building a boolean DataFrame
+    if all(isinstance(dtype, np.dtype) and dtype.kind in "fiu" for dtype in values.dtypes):
+        float_values = values.select_dtypes(include="floating")
+        if float_values.shape[1] == 0 or not np.isnan(float_values.to_numpy()).any():
+            return
+    # One isna() over all the columns; only the first offending column is reported in detail
+    nan_masks = values.isna()
+    nan_columns = nan_masks.columns[nan_masks.to_numpy().any(axis=0)]
+    if len(nan_columns):
+        col = nan_columns[0]
+        nan_mask = nan_masks[col].to_numpy()
+        nan_indices = df.index[nan_mask][:5].tolist()
+        nan_preview = df[col].to_numpy()[nan_mask][:5].tolist()
+        details = [
+            f"Row {idx}, Column '{col}', Value: {repr(val)}"
+            for idx, val in zip(nan_indices, nan_preview)
+        ]
+        raise ValueError(
+            f"NaN (missing) values found in column '{col}' in {context}.\n"
+            f"First 5 occurrences:\n" +
+            "\n".join(details) +
+            "\nPlease check your file for empty or invalid cells in these locations."
+        )
+
+@njit(cache=True)
+def _negative_columns(values):
+    """Flags the columns of a 2-D array that hold a negative value, stopping at the first one found."""
+    n_rows, n_cols = values.shape
+    negative = np.zeros(n_cols, dtype=np.bool_)
+    for j in range(n_cols):
+        for i in range(n_rows):
+            if values[i, j] < 0:
+                negative[j] = True
+                break
+    return negative
 
 def validate_positive_values(df, columns, context=""):
-    for col in columns:
-        neg_mask = df[col] < 0
-        if neg_mask.any():
-            neg_indices = df.index[neg_mask].tolist()
-            neg_preview = df.loc[neg_mask, col].head(5).tolist()
-            details = [
-                f"Row {idx}, Column '{col}', Value: {val}"
-                for idx, val in zip(neg_indices[:5], neg_preview)
-            ]
-            raise ValueError(
-                f"Negative values found in column '{col}' in {context}.\n"
-                f"First 5 occurrences:\n" +
-                "\n".join(details) +
-                "\nAll values in this column must be positive."
-            )
+    values = df[list(columns)]
+    # Numeric columns: with numba, one compiled scan that stops at each column's first negative;
+    # without it, a column-wise min (np.fmin skips NaN, as < 0 does). Neither builds a boolean
+    # DataFrame. Otherwise one comparison over all the columns.
+    # Only the first offending column is reported in detail.
+    numeric = all(
+        pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype) for dtype in values.dtypes
+    )
+    if numeric and NUMBA_AVAILABLE:
+        neg_columns = values.columns[_negative_columns(values.to_numpy(dtype=np.float64, na_value=np.nan))]
+    elif numeric and len(values):
+        neg_columns = values.columns[np.fmin.reduce(values.to_numpy(dtype=np.float64, na_value=np.nan), axis=0) < 0]
+    else:
+        neg_columns = values.columns[(values < 0).to_numpy().any(axis=0)]
+    if len(neg_columns):
+        col = neg_columns[0]
+        neg_mask = (values[col] < 0).to_numpy()
+        neg_indices = df.index[neg_mask][:5].tolist()
+        neg_preview = df[col].to_numpy()[neg_mask][:5].tolist()
+        details = [
+            f"Row {idx}, Column '{col}', Value: {val}"
+            for idx, val in zip(neg_indices, neg_preview)
+        ]
+        raise ValueError(
+            f"Negative values found in column '{col}' in {context}.\n"
+            f"First 5 occurrences:\n" +
+            "\n".join(details) +
+            "\nAll values in this column must be positive."
+        )
 
 def validate_percentage_sum(df, percentage_col, expected_sum=100, tolerance=0.5, context=""):
-    total = df[percentage_col].sum()
+    column = df[percentage_col]
+    if pd.api.types.is_numeric_dtype(column):
+        # NumPy's pairwise summation over the raw values, skipping NaN as Series.sum does
+        total = np.nansum(column.to_numpy(dtype=np.float64, na_value=np.nan))
+    else:
+        total = column.sum()
     if not (expected_sum - tolerance <= total <= expected_sum + tolerance):
         preview = df[[percentage_col]].head(5).to_dict(orient="records")
         raise ValueError(
@@ -54,6 +100,10 @@ def validate_percentage_sum(df, percentage_col, expected_sum=100, tolerance=0.5,
         )
 
 def validate_unique(df, columns, context=""):
+    # Distinct row hashes mean distinct rows, so the usual all-unique case needs no duplicate
+    # mask; equal hashes (a duplicate or a collision) fall through to the exact check
+    if pd.util.hash_pandas_object(df[list(columns)], index=False).is_unique:
+        return
     dup_mask = df.duplicated(subset=columns, keep=False)
     if dup_mask.any():
         dup_rows = df[dup_mask].head(5)
@@ -67,37 +117,53 @@ def validate_unique(df, columns, context=""):
         )
 
 def validate_file_exists(filepath):
-    import os
-    if not os.path.exists(filepath):
+    # A workbook created inside a sheet_cache() block is only saved when the block exits
+    if not os.path.exists(filepath) and not workbook_is_pending(filepath):
         raise FileNotFoundError(
             f"File not found: {filepath}\n"
             "Please check the file path and ensure the file exists."
         )
 
 def validate_sheet_exists(filepath, sheet_name):
-    import openpyxl
-    wb = openpyxl.load_workbook(filepath, read_only=True)
-    if sheet_name not in wb.sheetnames:
+    # A sheet written inside a sheet_cache() block exists even before the workbook is saved
+    pending = pending_sheet_names(filepath)
+    if sheet_name in pending:
+        return
+    if workbook_is_pending(filepath):
+        sheetnames = pending
+    else:
+        sheetnames = workbook_sheet_names(filepath)
+    if sheet_name not in sheetnames:
         raise ValueError(
             f"Sheet '{sheet_name}' not found in file '{filepath}'.\n"
-            f"Available sheets: {wb.sheetnames}\n"
+            f"Available sheets: {sheetnames}\n"
             "Please check the sheet name and try again."
         )
 
 def validate_datetime_column(df, column, context=""):
+    # Already datetime64 (e.g. read from a Parquet copy or a date-typed cell column): nothing to parse
+    if pd.api.types.is_datetime64_any_dtype(df[column]):
+        return
     try:
-        pd.to_datetime(df[column])
+        # cache=True parses each distinct string once
+        pd.to_datetime(df[column], cache=True)
     except Exception as e:
-        # Try to find the first problematic value
-        for idx, val in df[column].items():
+        # Find the first problematic value with one coercing parse: values that come back NaT
+        # without being missing to begin with are the ones that failed
+        bad_mask = (pd.to_datetime(df[column], errors="coerce").isna() & df[column].notna()).to_numpy()
+        if bad_mask.any():
+            pos = bad_mask.argmax()
+            idx, val = df.index[pos], df[column].iat[pos]
             try:
                 pd.to_datetime(val)
-            except Exception as e2:
-                raise ValueError(
-                    f"Invalid datetime value in column '{column}' at row {idx} in {context}.\n"
-                    f"Value: {repr(val)}\nError: {e2}\n"
-                    "Please correct or remove this value."
-                ) from e
+                e2 = e
+            except Exception as value_error:
+                e2 = value_error
+            raise ValueError(
+                f"Invalid datetime value in column '{column}' at row {idx} in {context}.\n"
+                f"Value: {repr(val)}\nError: {e2}\n"
+                "Please correct or remove this value."
+            ) from e
         # If not found, raise the original error
         raise ValueError(
             f"Invalid datetime in column '{column}' in {context}: {e}"
@@ -123,23 +189,23 @@ def validate_month(df, datetime_col, expected_month=None, context=""):
     """
     try:
         dt_series = pd.to_datetime(df[datetime_col])
-        months = dt_series.dt.month.unique()
+        month_map = dt_series.dt.month.to_numpy()
+        months = pd.unique(month_map)
     except Exception as e:
         raise ValueError(f"Invalid datetime in column '{datetime_col}' in {context}: {e}")
     if len(months) > 1:
         # Show which rows have which months
-        month_map = dt_series.dt.month
         details = []
         for m in months:
-            indices = df.index[month_map == m].tolist()
-            details.append(f"Month {m}: rows {indices[:5]}{'...' if len(indices) > 5 else ''}")
+            indices = df.index[month_map == m]
+            details.append(f"Month {m}: rows {indices[:5].tolist()}{'...' if len(indices) > 5 else ''}")
         raise ValueError(
             f"Data contains multiple months {months} in {context}.\n" +
             "\n".join(details) +
             "\nPlease ensure all data is from a single month."
         )
     if expected_month is not None and months[0] != expected_month:
-        indices = df.index[dt_series.dt.month != expected_month].tolist()
+        indices = df.index[month_map != expected_month].tolist()
         raise ValueError(
             f"Data month {months[0]} does not match expected {expected_month} in {context}.\n"
             f"First 5 mismatched row indices: {indices[:5]}\n"
@@ -147,6 +213,45 @@ def validate_month(df, datetime_col, expected_month=None, context=""):
         )
     return months[0]
 
+def validate_upload(df, required_columns, positive_columns, datetime_col, context=""):
+    """
+    Runs the upload checks of the app's validation steps over one DataFrame: required columns,
+    missing values, negative values, non-empty data and month consistency, in that order.
+    The required columns are selected once and that frame is shared by the later checks.
+    - df: pandas DataFrame
+    - required_columns: columns that must exist and contain no NaN
+    - positive_columns: columns that must not contain negative values
+    - datetime_col: column whose values must all fall in one month
+    - context: string for error messages
+    Returns: list of (message, error) tuples for the checks that ran, error being None for a
+    passed check; the list ends at the first failed check.
+    """
+    results = []
+    values = df
+
+    def run(message, check):
+        try:
+            check()
+        except Exception as e:
+            results.append((message, e))
+            return False
+        results.append((message, None))
+        return True
+
+    if not run("Checking required columns...", lambda: validate_columns(df, required_columns, context=context)):
+        return results
+    values = df[list(required_columns)]
+    checks = [
+        ("Checking for missing values...", lambda: validate_no_nans(values, required_columns, context=context)),
+        ("Checking for positive values...", lambda: validate_positive_values(values, positive_columns, context=context)),
+        ("Checking for non-empty data...", lambda: validate_nonempty(values, context=context)),
+        ("Checking month consistency...", lambda: validate_month(values, datetime_col, context=context)),
+    ]
+    for message, check in checks:
+        if not run(message, check):
+            break
+    return results
+
 def validate_15min_granularity(df, datetime_col, context="", tolerance_seconds=60, strict=True):
     """
     Validates that all datetime values are at 15-minute intervals and consecutive rows are spaced by 15 minutes.
@@ -162,21 +267,19 @@ def validate_15min_granularity(df, datetime_col, context="", tolerance_seconds=6
     except Exception as e:
         raise ValueError(f"Invalid datetime in column '{datetime_col}' in {context}: {e}")
 
-    # Check all timestamps are aligned to 15-minute intervals (with optional tolerance)
-    aligned = []
-    for ts in dt_series:
-        # Find the nearest 15-min mark
-        minute = ts.minute
-        second = ts.second
-        microsecond = ts.microsecond
-        total_seconds = minute * 60 + second
-        # Find how far from the nearest 15-min mark (0, 15, 30, 45)
-        nearest = min([abs(total_seconds - m * 60) for m in [0, 15, 30, 45]])
-        if strict:
-            aligned.append((minute % 15 == 0) and (second == 0) and (microsecond == 0))
-        else:
-            aligned.append(nearest <= tolerance_seconds and microsecond == 0)
-    not_15min = ~pd.Series(aligned)
+    # Check all timestamps are aligned to 15-minute intervals (with optional tolerance), on the
+    # int64 microsecond values rather than one Timestamp at a time
+    valid = dt_series.notna().to_numpy()
+    micros = dt_series.to_numpy(dtype="datetime64[us]").view(np.int64)
+    microsecond = micros % 10**6
+    if strict:
+        aligned = micros % (15 * 60 * 10**6) == 0
+    else:
+        # Seconds past the hour, and how far that is from the nearest 15-min mark (0, 15, 30, 45)
+        total_seconds = (micros // 10**6) % 3600
+        nearest = np.abs(total_seconds[:, None] - np.array([0, 900, 1800, 2700])).min(axis=1)
+        aligned = (nearest <= tolerance_seconds) & (microsecond == 0)
+    not_15min = ~(aligned & valid)
     if not_15min.any():
         bad_times = dt_series[not_15min].head(5).tolist()
         bad_indices = df.index[not_15min].tolist()[:5]
@@ -200,7 +303,7 @@ def validate_15min_granularity(df, datetime_col, context="", tolerance_seconds=6
     if strict:
         not_15min_diff = ~(diffs == pd.Timedelta(minutes=15))
     else:
-        not_15min_diff = ~(diffs.apply(lambda x: abs(x.total_seconds() - 900) <= tolerance_seconds))
+        not_15min_diff = ~((diffs.dt.total_seconds() - 900).abs() <= tolerance_seconds)
     if not_15min_diff.any():
         bad_indices = diffs[not_15min_diff].index[:5].tolist()
         bad_deltas = diffs[not_15min_diff].head(5).tolist()